@@ -1,2 +1,43 @@
+from collections import deque
+
+# Any non-user role is rendered as the assistant
+_PREFIX = {"user": "User: ", "assistant": "Assistant: "}
+
+
 class ConversationMemory:
-    def __init__(self): self.history = []
+    """
+    Sliding-window chat memory.
+    Keeps the last `max_turns` user/assistant exchanges as {role, content} dicts.
+    """
+    def __init__(self, max_turns=10):
+        self.max_turns = max_turns
+        # Bounded deque evicts the oldest message on append, no re-slicing needed
+        self.history = deque(maxlen=max_turns * 2)
+        # Joined context string, extended on append and rebuilt only after an eviction
+        self._context = ""
+
+    @staticmethod
+    def _format(msg):
+        return _PREFIX.get(msg["role"], "Assistant: ") + msg["content"]
+
+    def add(self, role, content):
+        msg = {"role": role, "content": content}
+        evicting = len(self.history) == self.history.maxlen
+        self.history.append(msg)
+        if evicting:
+            self._context = None
+        elif self._context is not None:
+            line = self._format(msg)
+            self._context = f"{self._context}\n{line}" if self._context else line
+
+    def get_context_string(self):
+        if self._context is None:
+            self._context = "\n".join(self._format(msg) for msg in self.history)
+        return self._context
+
+    def clear(self):
+        self.history.clear()
+        self._context = ""
+
+    def __len__(self):
+        return len(self.history)
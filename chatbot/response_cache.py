@@ -0,0 +1,143 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import joblib
+    _joblib_available = True
+except ImportError:
+    joblib = None
+    _joblib_available = False
+
+
+class ResponseCache:
+    """
+    Semantic answer cache for the chatbot.
+    Exact question matches are served from a dict; otherwise the query embedding
+    is compared against every cached embedding and the closest answer is reused
+    when its cosine similarity clears `threshold`.
+    Entries expire after `ttl_s` and the least recently used are evicted past `max_entries`.
+    The optional `context` (the conversation history) is part of the key: the same question
+    asked mid-conversation is a different prompt and only matches entries with that history.
+    """
+    def __init__(self, threshold=0.95, max_entries=10_000, ttl_s=7 * 24 * 3600, path=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.path = path
+        # (context digest, question) -> (embedding or None, answer, created_at), oldest first
+        self.entries = OrderedDict()
+        # Stacked unit embeddings, rebuilt lazily after the entry set changes
+        self._matrix = None
+        self._matrix_keys = []
+        self._matrix_contexts = None
+        # /api/chat runs in FastAPI's threadpool and shares the cache with the stream endpoint
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @staticmethod
+    def _normalize(question):
+        return " ".join(question.lower().split())
+
+    @classmethod
+    def _key(cls, question, context):
+        digest = hashlib.blake2b(context.encode("utf-8"), digest_size=16).hexdigest() if context else ""
+        return digest, cls._normalize(question)
+
+    def _expired(self, created_at):
+        return time.time() - created_at > self.ttl_s
+
+    def _invalidate(self):
+        self._matrix = None
+        self._matrix_keys = []
+        self._matrix_contexts = None
+
+    def get(self, question, embedding=None, context=""):
+        """Return a cached answer for the question, or None on a miss."""
+        with self._lock:
+            return self._get(self._key(question, context), embedding)
+
+    def _get(self, key, embedding):
+        entry = self.entries.get(key)
+        if entry is not None:
+            if self._expired(entry[2]):
+                del self.entries[key]
+                self._invalidate()
+            else:
+                self.entries.move_to_end(key)
+                return entry[1]
+
+        if embedding is None:
+            return None
+        if self._matrix is None:
+            self._matrix_keys = [k for k, e in self.entries.items() if e[0] is not None]
+            if not self._matrix_keys:
+                return None
+            self._matrix = np.stack([self.entries[k][0] for k in self._matrix_keys])
+            self._matrix_contexts = np.array([k[0] for k in self._matrix_keys])
+
+        # Embeddings are unit-length, so one matmul gives cosine similarity to every entry;
+        # entries from another conversation context never match
+        sims = np.where(self._matrix_contexts == key[0], self._matrix @ embedding, -np.inf)
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        key = self._matrix_keys[best]
+        _, answer, created_at = self.entries[key]
+        if self._expired(created_at):
+            del self.entries[key]
+            self._invalidate()
+            return None
+        self.entries.move_to_end(key)
+        return answer
+
+    def put(self, question, answer, embedding=None, context=""):
+        key = self._key(question, context)
+        with self._lock:
+            self.entries[key] = (embedding, answer, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._invalidate()
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path or not _joblib_available:
+            return
+        with self._lock:
+            entries = dict(self.entries)
+        joblib.dump(entries, path)
+
+    def load(self, path=None):
+        path = path or self.path
+        if not path or not _joblib_available:
+            return
+        try:
+            entries = joblib.load(path)
+        except Exception as e:
+            print(f"Warning: Failed to load response cache: {e}")
+            return
+        # Files written before entries were keyed on context have plain question keys
+        entries = OrderedDict(
+            (k, v) for k, v in sorted(entries.items(), key=lambda kv: kv[1][2])
+            if isinstance(k, tuple) and not self._expired(v[2])
+        )
+        # The file may come from a run with a larger max_entries; keep the newest
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        with self._lock:
+            self.entries = entries
+            self._invalidate()
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self._invalidate()
+
+    def __len__(self):
+        return len(self.entries)
@@ -1,16 +1,463 @@
+import os
+import re
+import json
+import asyncio
+from functools import lru_cache
+
+import numpy as np
+
+from chatbot.memory import ConversationMemory
+from chatbot.response_cache import ResponseCache
+
+try:
+    import httpx
+    _httpx_available = True
+except ImportError:
+    httpx = None
+    _httpx_available = False
+
+try:
+    import orjson
+    _orjson_available = True
+except ImportError:
+    orjson = None
+    _orjson_available = False
+
+try:
+    from rag_pipeline.retriever import get_retriever
+    _rag_available = True
+except ImportError:
+    get_retriever = None
+    _rag_available = False
+
+GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODEL = "llama-3.1-8b-instant"
+HF_URL = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.2"
+
+
+def _dumps(obj):
+    return orjson.dumps(obj) if _orjson_available else json.dumps(obj).encode()
+
+
+def _loads(data):
+    return orjson.loads(data) if _orjson_available else json.loads(data)
+
+
+def _auth_headers(token):
+    # Bodies are pre-serialized, so the content type is set explicitly
+    return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+
+# Topic keywords for the rule-based fallback, matched in a single scan
+_TOPIC_RE = re.compile(
+    r"\b(?:(?P<risk>risks?|scores?|predict\w*|probabilit\w*)"
+    r"|(?P<brake>brak\w*|stopping)"
+    r"|(?P<battery>batter\w*|start\w*))\b",
+    re.IGNORECASE,
+)
+# Checked in priority order when a question touches several topics
+_TOPIC_TIPS = {
+    "risk": ("\nRisk scores come from the XGBoost model, which weighs risk factors such as "
+             "vehicle age, mileage, reported issues and component condition."),
+    "brake": ("\nBrakes are a safety-critical system: inspect pads and rotors promptly if you "
+              "notice noise, vibration or longer stopping distances."),
+    "battery": "\nTest battery voltage regularly; weak batteries are a leading cause of breakdowns.",
+}
+
+# Upper bound on (estimated) prompt size so prefill stays bounded: the oldest history turns
+# are dropped first, then the least relevant knowledge chunks; the question is never cut
+PROMPT_TOKEN_BUDGET = 2048
+
+
+def estimate_tokens(text):
+    """Approximate token count (~4 characters per token for English BPE vocabularies)."""
+    return len(text) // 4 + 1
+
+
+@lru_cache(maxsize=256)
+def _format_knowledge(chunks):
+    """Renders the knowledge section; follow-up turns often retrieve the same chunks."""
+    # Repeats are dropped but the retriever's relevance order is kept, most relevant first
+    return "### Relevant Knowledge\n" + "\n".join(f"- {chunk}" for chunk in dict.fromkeys(chunks)) + "\n\n"
+
+
+REQUEST_TIMEOUT_S = 30
+CONNECT_TIMEOUT_S = 5
+MAX_KEEPALIVE_CONNECTIONS = 32
+LLM_ERROR_PREFIX = "(LLM error, falling back) "
+
+
 class VehicleAI:
     """
     Phase 10: Conversational AI
     - Memory Handling
     - Contextual Reasoning
+    - LLM backends (Groq / HuggingFace) with a rule-based fallback
     """
-    def __init__(self):
-        self.memory = []
-        
-    def ask(self, question):
-        self.memory.append(question)
-        return f"AI: Based on your vehicle history, {question} is worth investigating."
+    SYSTEM_PROMPT = (
+        "You are an expert vehicle maintenance assistant for a fleet management platform. "
+        "Answer questions about servicing, component wear, failure risk and repair costs. "
+        "Use the provided knowledge when it is relevant, keep answers concise and practical, "
+        "and recommend a professional inspection for anything safety-critical."
+    )
+    _SYSTEM_SECTION = SYSTEM_PROMPT + "\n\n"
+    _SYSTEM_TOKENS = estimate_tokens(SYSTEM_PROMPT)
+
+    def __init__(self, retriever=None):
+        self.memory = ConversationMemory()
+
+        if os.environ.get("GROQ_API_KEY"):
+            self.backend = "groq"
+        elif os.environ.get("HF_TOKEN"):
+            self.backend = "huggingface"
+        else:
+            self.backend = "rule-based"
+
+        # RAG retriever is loaded on first use unless one is injected. Without an index a
+        # retriever only returns a placeholder message, so an injected one is dropped too
+        self._retriever = retriever if retriever is not None and retriever.index is not None else None
+        self._retriever_initialized = retriever is not None
+
+        # Repeated / near-identical questions skip the LLM round trip
+        self.cache = ResponseCache(path=os.environ.get("RESPONSE_CACHE_PATH"))
+
+        # Pooled HTTP clients, created on first LLM call and kept alive across turns
+        self._client = None
+        self._async_client = None
+
+    def _http_options(self):
+        return {
+            "timeout": httpx.Timeout(REQUEST_TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+            "limits": httpx.Limits(max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS),
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.Client(**self._http_options())
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._http_options())
+        return self._async_client
+
+    async def aclose(self):
+        """Close the pooled HTTP connections."""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    @property
+    def retriever(self):
+        if not self._retriever_initialized:
+            self._retriever_initialized = True
+            if _rag_available:
+                try:
+                    retriever = get_retriever()
+                    # Without an index the retriever only returns a placeholder message
+                    self._retriever = retriever if retriever.index is not None else None
+                except Exception as e:
+                    print(f"Warning: Failed to initialize RAG retriever: {e}")
+                    self._retriever = None
+        return self._retriever
+
+    def _retrieve_context(self, question, k=3):
+        retriever = self.retriever
+        if retriever is None:
+            return []
+        try:
+            return retriever.retrieve(question, k=k)
+        except Exception as e:
+            print(f"Warning: Retrieval failed: {e}")
+            return []
+
+    def _embed(self, question):
+        # Reuse the retriever's sentence-transformer rather than loading a second model
+        model = getattr(self.retriever, "model", None)
+        if model is None:
+            return None
+        try:
+            emb = np.asarray(model.encode([question], normalize_embeddings=True), dtype=np.float32)
+            return emb[0]
+        except Exception as e:
+            print(f"Warning: Query embedding failed: {e}")
+            return None
+
+    def _use_cache(self):
+        """Only real LLM answers are worth caching."""
+        return self.backend != "rule-based" and _httpx_available
+
+    def _cached_answer(self, question, history):
+        """
+        Look up the response cache; returns (answer or None, query embedding or None).
+        Entries are keyed on the history too, so a follow-up like "what about the second
+        one?" is never answered from another conversation's entry.
+        """
+        if not self._use_cache():
+            return None, None
+        # Exact repeats are answered before paying for an embedding
+        answer = self.cache.get(question, context=history)
+        if answer is not None:
+            return answer, None
+        embedding = self._embed(question)
+        return self.cache.get(question, embedding, context=history), embedding
+
+    def _retrieve_contexts(self, questions, k=3):
+        """Context for several questions, embedded and searched as one batch."""
+        retriever = self.retriever
+        if retriever is None:
+            return [[] for _ in questions]
+        try:
+            return retriever.retrieve_batch(questions, k=k)
+        except Exception as e:
+            print(f"Warning: Batch retrieval failed: {e}")
+            return [self._retrieve_context(q, k=k) for q in questions]
+
+    def ask(self, question, memory=None):
+        """
+        Answer a question and record the exchange in memory.
+        `memory` selects the conversation; the instance's own memory is used by default.
+        """
+        memory = self.memory if memory is None else memory
+        history = memory.get_context_string()
+        answer, embedding = self._cached_answer(question, history)
+        if answer is None:
+            chunks = self._retrieve_context(question)
+
+            if self.backend == "groq":
+                answer = self._call_groq(question, chunks, memory)
+            elif self.backend == "huggingface":
+                answer = self._call_huggingface(question, chunks, memory)
+            else:
+                answer = self._rule_based_response(question, chunks)
+
+            if self._use_cache() and answer and not answer.startswith(LLM_ERROR_PREFIX):
+                self.cache.put(question, answer, embedding, context=history)
+
+        memory.add("user", question)
+        memory.add("assistant", answer)
+        return answer
+
+    async def ask_stream(self, question, memory=None):
+        """Async variant of `ask` that yields the answer as it is generated."""
+        memory = self.memory if memory is None else memory
+        history = memory.get_context_string()
+        answer, embedding = self._cached_answer(question, history)
+        if answer is not None:
+            yield answer
+            memory.add("user", question)
+            memory.add("assistant", answer)
+            return
+
+        chunks = self._retrieve_context(question)
+
+        if self.backend == "groq":
+            pieces = self._stream_groq(question, chunks, memory)
+        elif self.backend == "huggingface":
+            pieces = self._stream_huggingface(question, chunks, memory)
+        else:
+            pieces = None
+
+        if pieces is None:
+            answer = self._rule_based_response(question, chunks)
+            yield answer
+        else:
+            parts = []
+            try:
+                async for piece in pieces:
+                    parts.append(piece)
+                    yield piece
+            except Exception as e:
+                print(f"Warning: Streaming request failed: {e}")
+                # Tokens already sent stay as they are; only an empty stream gets the fallback
+                if not parts:
+                    parts.append(LLM_ERROR_PREFIX + self._rule_based_response(question, chunks))
+                    yield parts[0]
+                answer = "".join(parts)
+            else:
+                answer = "".join(parts)
+                # Only a stream that finished cleanly is a complete answer worth caching
+                if answer and self._use_cache():
+                    self.cache.put(question, answer, embedding, context=history)
+
+        memory.add("user", question)
+        memory.add("assistant", answer)
+
+    async def ask_batch(self, questions):
+        """
+        Answer several independent questions with the LLM calls issued concurrently.
+        Every prompt sees the history as it was before the batch; exchanges are then
+        recorded in question order.
+        """
+        contexts = self._retrieve_contexts(questions)
+        if self.backend == "rule-based" or not _httpx_available:
+            answers = [self._rule_based_response(q, chunks) for q, chunks in zip(questions, contexts)]
+        else:
+            answers = await asyncio.gather(*(self._acall(q, chunks) for q, chunks in zip(questions, contexts)))
+
+        for question, answer in zip(questions, answers):
+            self.memory.add("user", question)
+            self.memory.add("assistant", answer)
+        return list(answers)
+
+    async def _acall(self, question, chunks):
+        if self.backend == "groq":
+            url, token, payload = GROQ_URL, os.environ.get("GROQ_API_KEY", ""), self._groq_payload(question, chunks)
+        else:
+            url, token, payload = HF_URL, os.environ.get("HF_TOKEN", ""), self._hf_payload(question, chunks)
+        try:
+            resp = await self.async_client.post(url, headers=_auth_headers(token), content=_dumps(payload))
+            resp.raise_for_status()
+            data = _loads(resp.content)
+            if self.backend == "groq":
+                return data["choices"][0]["message"]["content"].strip()
+            return data[0]["generated_text"].strip()
+        except Exception as e:
+            print(f"Warning: LLM request failed: {e}")
+            return LLM_ERROR_PREFIX + self._rule_based_response(question, chunks)
+
+    def _fit_history(self, question, memory):
+        """Keeps the newest turns that fit beside the system prompt and the question."""
+        history = memory.get_context_string()
+        room = PROMPT_TOKEN_BUDGET - self._SYSTEM_TOKENS - estimate_tokens(question)
+        if estimate_tokens(history) <= room:
+            return history
+        # Whole messages only; per-line estimates add up to at least the joined string's
+        kept = []
+        for msg in reversed(memory.history):
+            line = memory._format(msg)
+            room -= estimate_tokens(line)
+            if room < 0:
+                break
+            kept.append(line)
+        return "\n".join(reversed(kept))
+
+    def _fit_chunks(self, question, chunks, history):
+        """Keeps the most relevant chunks that fit in what the prompt budget leaves over."""
+        budget = PROMPT_TOKEN_BUDGET - self._SYSTEM_TOKENS - estimate_tokens(history) - estimate_tokens(question)
+        kept = []
+        for chunk in chunks:
+            budget -= estimate_tokens(chunk)
+            if budget < 0:
+                break
+            kept.append(chunk)
+        return kept
+
+    def _build_prompt(self, question, chunks, include_system=True, memory=None):
+        # Ordered stable-to-volatile so the provider's prefix cache can reuse earlier turns:
+        # system prompt, then the append-only history, then this turn's knowledge and question
+        system = self._SYSTEM_SECTION if include_system else ""
+        history = self._fit_history(question, self.memory if memory is None else memory)
+        # Chunks arrive in relevance order, so trimming to budget drops the least relevant
+        chunks = self._fit_chunks(question, chunks, history)
+        history = f"### Conversation History\n{history}\n\n" if history else ""
+        knowledge = _format_knowledge(tuple(chunks)) if chunks else ""
+        return f"{system}{history}{knowledge}### Question\n{question}"
+
+    def _groq_payload(self, question, chunks, stream=False, memory=None):
+        return {
+            "model": GROQ_MODEL,
+            "messages": [
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                # The system prompt travels only in the system role, not again in the user turn
+                {"role": "user", "content": self._build_prompt(question, chunks, include_system=False, memory=memory)},
+            ],
+            "temperature": 0.3,
+            "max_tokens": 512,
+            "stream": stream,
+        }
+
+    def _hf_payload(self, question, chunks, stream=False, memory=None):
+        return {
+            "inputs": self._build_prompt(question, chunks, memory=memory),
+            "parameters": {"max_new_tokens": 512, "temperature": 0.3, "return_full_text": False},
+            "stream": stream,
+        }
+
+    def _call_groq(self, question, chunks, memory=None):
+        if not _httpx_available:
+            return self._rule_based_response(question, chunks)
+
+        headers = _auth_headers(os.environ.get("GROQ_API_KEY", ""))
+        try:
+            resp = self.client.post(GROQ_URL, headers=headers, content=_dumps(self._groq_payload(question, chunks, memory=memory)))
+            resp.raise_for_status()
+            return _loads(resp.content)["choices"][0]["message"]["content"].strip()
+        except Exception as e:
+            print(f"Warning: Groq request failed: {e}")
+            return LLM_ERROR_PREFIX + self._rule_based_response(question, chunks)
+
+    def _call_huggingface(self, question, chunks, memory=None):
+        if not _httpx_available:
+            return self._rule_based_response(question, chunks)
+
+        headers = _auth_headers(os.environ.get("HF_TOKEN", ""))
+        try:
+            resp = self.client.post(HF_URL, headers=headers, content=_dumps(self._hf_payload(question, chunks, memory=memory)))
+            resp.raise_for_status()
+            return _loads(resp.content)[0]["generated_text"].strip()
+        except Exception as e:
+            print(f"Warning: HuggingFace request failed: {e}")
+            return LLM_ERROR_PREFIX + self._rule_based_response(question, chunks)
+
+    def _stream_groq(self, question, chunks, memory=None):
+        if not _httpx_available:
+            return None
+        headers = _auth_headers(os.environ.get("GROQ_API_KEY", ""))
+        return self._stream_sse(GROQ_URL, headers, self._groq_payload(question, chunks, stream=True, memory=memory),
+                                lambda event: event["choices"][0]["delta"].get("content"))
+
+    def _stream_huggingface(self, question, chunks, memory=None):
+        if not _httpx_available:
+            return None
+        headers = _auth_headers(os.environ.get("HF_TOKEN", ""))
+        return self._stream_sse(HF_URL, headers, self._hf_payload(question, chunks, stream=True, memory=memory),
+                                lambda event: None if event["token"].get("special") else event["token"]["text"])
+
+    async def _stream_sse(self, url, headers, payload, extract):
+        # Both providers stream server-sent events: "data: {...}" lines, Groq ends with "data: [DONE]".
+        # Failures propagate so ask_stream can tell a truncated answer from a complete one
+        async with self.async_client.stream("POST", url, headers=headers, content=_dumps(payload)) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                piece = extract(_loads(data))
+                if piece:
+                    yield piece
+
+    def _rule_based_response(self, question, chunks):
+        if not chunks:
+            return ("I'm your vehicle maintenance assistant. I couldn't find specific guidance for that, "
+                    "but regular servicing, tire checks and brake inspections prevent most failures. "
+                    "Try asking about oil changes, tires, brakes, batteries or risk scores.")
+
+        lines = ["Here's what I found in the maintenance knowledge base:"]
+        for chunk in chunks:
+            lines.append(f"- {chunk[:300]}..." if len(chunk) > 300 else f"- {chunk}")
+
+        topics = {m.lastgroup for m in _TOPIC_RE.finditer(question)}
+        for topic, tip in _TOPIC_TIPS.items():
+            if topic in topics:
+                lines.append(tip)
+                break
+        return "\n".join(lines)
+
 
 if __name__ == "__main__":
     ai = VehicleAI()
-    print(ai.ask("Explain the risk score."))
+    questions = [
+        "Explain the risk score.",
+        "How often should I change the oil?",
+        "My brakes squeal, is that a problem?",
+    ]
+    for question, answer in zip(questions, asyncio.run(ai.ask_batch(questions))):
+        print(f"Q: {question}\nA: {answer}\n")
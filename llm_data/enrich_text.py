@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import os
 
 def enrich_text(df_path='features/vehicle_features.csv'):
@@ -13,17 +14,19 @@ def enrich_text(df_path='features/vehicle_features.csv'):
         
     df = pd.read_csv(df_path)
     
-    def generate_summary(row):
-        return f"A {row['Vehicle_Age']}-year-old {row['Vehicle_Model']} with {row['Mileage']} km mileage. Last service was on {row['Last_Service_Date']}."
-        
-    def generate_recommendation(row):
-        if row['Need_Maintenance'] == 1:
-            return f"Immediate maintenance required for {row['Vehicle_Model']} due to {row['Reported_Issues']} reported issues and high mileage intensity."
-        else:
-            return f"Vehicle is in stable condition. Next routine check recommended after 5,000 km."
-
-    df['vehicle_summary'] = df.apply(generate_summary, axis=1)
-    df['maintenance_recommendation'] = df.apply(generate_recommendation, axis=1)
+    # Column-wise string ops instead of a per-row apply
+    model = df['Vehicle_Model'].astype(str)
+    df['vehicle_summary'] = (
+        "A " + df['Vehicle_Age'].astype(str) + "-year-old " + model
+        + " with " + df['Mileage'].astype(str) + " km mileage. Last service was on "
+        + df['Last_Service_Date'].astype(str) + "."
+    )
+    df['maintenance_recommendation'] = np.where(
+        df['Need_Maintenance'].eq(1),
+        "Immediate maintenance required for " + model + " due to "
+        + df['Reported_Issues'].astype(str) + " reported issues and high mileage intensity.",
+        "Vehicle is in stable condition. Next routine check recommended after 5,000 km.",
+    )
     
     # Save enriched data
     os.makedirs('llm_data', exist_ok=True)
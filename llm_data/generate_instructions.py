@@ -1,30 +1,65 @@
 import pandas as pd
 import json
 import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-def create_instruction_dataset(df_path='llm_data/text_enriched.csv'):
+INSTRUCTION = "Evaluate the maintenance risk for this vehicle."
+COLUMNS = ['vehicle_summary', 'maintenance_recommendation']
+
+def _write_rows(f, summaries, recommendations):
+    for summary, rec in zip(summaries, recommendations):
+        f.write(json.dumps({"instruction": INSTRUCTION, "input": summary, "output": rec}) + '\n')
+
+def _write_shard(shard_path, summaries, recommendations):
+    with open(shard_path, 'w') as f:
+        _write_rows(f, summaries, recommendations)
+    return shard_path
+
+def _append_shard(out, shard_path):
+    with open(shard_path, 'rb') as shard:
+        shutil.copyfileobj(shard, out)
+    os.remove(shard_path)
+
+def create_instruction_dataset(df_path='llm_data/text_enriched.csv', n_samples=100, chunksize=50_000, max_workers=None):
     """
     Phase 7: Instruction Dataset Generation
     Generates Instruction -> Input -> Output pairs for fine-tuning.
+    Pass n_samples=None to convert the whole CSV; inputs spanning several chunks
+    are serialized in parallel, one JSONL shard per chunk.
     """
     if not os.path.exists(df_path): return
-    df = pd.read_csv(df_path)
     
-    dataset = []
-    for _, row in df.head(100).iterrows():
-        sample = {
-            "instruction": "Evaluate the maintenance risk for this vehicle.",
-            "input": row['vehicle_summary'],
-            "output": row['maintenance_recommendation']
-        }
-        dataset.append(sample)
-        
     os.makedirs('llm_data', exist_ok=True)
-    with open('llm_data/instruction_dataset.jsonl', 'w') as f:
-        for entry in dataset:
-            f.write(json.dumps(entry) + '\n')
+    out_path = 'llm_data/instruction_dataset.jsonl'
+    # Stream only the two needed columns
+    reader = pd.read_csv(df_path, usecols=COLUMNS, nrows=n_samples, chunksize=chunksize)
+
+    if n_samples is not None and n_samples <= chunksize:
+        # A single chunk: a worker pool would cost more than the work itself
+        with open(out_path, 'w') as f:
+            for chunk in reader:
+                _write_rows(f, chunk['vehicle_summary'].to_numpy(), chunk['maintenance_recommendation'].to_numpy())
+    else:
+        max_workers = max_workers or os.cpu_count() or 1
+        with tempfile.TemporaryDirectory(dir='llm_data') as shard_dir, \
+                ProcessPoolExecutor(max_workers=max_workers) as ex, open(out_path, 'wb') as out:
+            # At most 2x workers chunks in flight, so the CSV is still streamed rather than
+            # pickled into the pool all at once. Shards are appended in submission order
+            # so the output matches a sequential run
+            pending = deque()
+            for i, chunk in enumerate(reader):
+                if len(pending) >= 2 * max_workers:
+                    _append_shard(out, pending.popleft().result())
+                pending.append(ex.submit(_write_shard, os.path.join(shard_dir, f"shard_{i}.jsonl"),
+                                         chunk['vehicle_summary'].to_numpy(),
+                                         chunk['maintenance_recommendation'].to_numpy()))
+            while pending:
+                _append_shard(out, pending.popleft().result())
             
-    print("Instruction dataset saved to llm_data/instruction_dataset.jsonl")
+    print(f"Instruction dataset saved to {out_path}")
 
 if __name__ == "__main__":
     create_instruction_dataset()
@@ -1,14 +1,24 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import sys
 import os
+import json
+import math
+import uuid
+import threading
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
+from typing import Optional
+import numpy as np
 
 # Add the project root to sys.path to ensure modules can be imported
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from chatbot.memory import ConversationMemory
 from chatbot.vehicle_ai import VehicleAI
-from rag_pipeline.retriever import RAGRetriever
+from rag_pipeline.retriever import get_retriever, RetrievalBatcher
 
 app = FastAPI(
     title="Vehicle Maintenance AI API",
@@ -18,12 +28,129 @@ app = FastAPI(
 
 # Initialize AI & RAG components
 try:
-    vehicle_ai = VehicleAI()
-    rag_retriever = RAGRetriever()
+    # The chatbot and /api/retrieve share one retriever (one embedding model + index)
+    rag_retriever = get_retriever()
+    retrieval_batcher = RetrievalBatcher(rag_retriever)
+    vehicle_ai = VehicleAI(retriever=rag_retriever)
 except Exception as e:
     print(f"Warning: Failed to initialize AI components: {e}")
     vehicle_ai = None
     rag_retriever = None
+    retrieval_batcher = None
+
+# Conversation id -> ConversationMemory; least recently used are dropped past MAX_CONVERSATIONS
+MAX_CONVERSATIONS = 1000
+_conversations = OrderedDict()
+_conversations_lock = threading.Lock()
+
+def get_conversation(conversation_id=None):
+    """
+    Returns (conversation_id, memory). A request without an id starts a new conversation,
+    so clients never see each other's history and opening questions can hit the response cache.
+    """
+    with _conversations_lock:
+        memory = _conversations.get(conversation_id) if conversation_id else None
+        if memory is None:
+            conversation_id = conversation_id or uuid.uuid4().hex
+            memory = _conversations[conversation_id] = ConversationMemory()
+        _conversations.move_to_end(conversation_id)
+        while len(_conversations) > MAX_CONVERSATIONS:
+            _conversations.popitem(last=False)
+    return conversation_id, memory
+
+# --- ML risk model ---
+# XGBoost native format (.ubj/.json, from XGBClassifier.get_booster().save_model(...)) is
+# preferred; a joblib-pickled sklearn-style classifier is still accepted
+MODEL_PATH = os.environ.get("MODEL_PATH", "models/xgb_model.ubj")
+
+# Training-time layout (see MaintenancePridictiveModel.ipynb): raw numerics, engineered
+# features, then pd.get_dummies(drop_first=True) columns for each categorical
+NUMERIC_FEATURES = [
+    "Mileage", "Reported_Issues", "Vehicle_Age", "Engine_Size", "Odometer_Reading",
+    "Insurance_Premium", "Service_History", "Accident_History", "Fuel_Efficiency",
+    "aging_factor", "mileage_age_interaction", "issues_mileage_interaction",
+    "Days_Since_Last_Service", "Warranty_Remaining_Days",
+]
+CATEGORIES = {
+    "Vehicle_Model": ["Bus", "Car", "Motorcycle", "Suv", "Truck", "Van"],
+    "Maintenance_History": ["Average", "Good", "Poor"],
+    "Fuel_Type": ["Diesel", "Electric", "Petrol"],
+    "Transmission_Type": ["Automatic", "Manual"],
+    "Owner_Type": ["First", "Second", "Third"],
+    "Tire_Condition": ["Good", "New", "Worn Out"],
+    "Brake_Condition": ["Good", "New", "Worn Out"],
+    "Battery_Status": ["Good", "New", "Weak"],
+}
+FEATURE_COLUMNS = NUMERIC_FEATURES + [
+    f"{col}_{value}" for col, values in CATEGORIES.items() for value in values[1:]
+]
+
+# Precomputed column positions so a request fills a numpy row directly, no DataFrame
+FeatureLayout = namedtuple("FeatureLayout", ["n_features", "numeric_idx", "category_idx"])
+
+def build_feature_layout(columns):
+    col_idx = {col: i for i, col in enumerate(columns)}
+    return FeatureLayout(
+        n_features=len(columns),
+        numeric_idx=np.array([col_idx[col] for col in NUMERIC_FEATURES]),
+        # Per categorical: request value -> one-hot column index (None for the dropped baseline)
+        category_idx={
+            col: {value: col_idx.get(f"{col}_{value}") for value in values}
+            for col, values in CATEGORIES.items()
+        },
+    )
+
+@lru_cache(maxsize=1)
+def get_model():
+    """
+    Loads the risk model and its feature layout on the first /api/predict call,
+    so joblib/xgboost stay out of server start-up. Returns (predict_proba, layout),
+    where predict_proba maps a (1, n_features) row to P(needs maintenance),
+    or (None, None) when no model is available.
+    """
+    try:
+        if MODEL_PATH.endswith((".ubj", ".json")):
+            import xgboost
+            booster = xgboost.Booster()
+            booster.load_model(MODEL_PATH)
+            # Single-row requests: thread fan-out costs more than it saves
+            booster.set_param({"nthread": 1})
+            columns = booster.feature_names or FEATURE_COLUMNS
+            # inplace_predict reads the numpy row directly (no DMatrix) and returns
+            # the positive-class probability for a binary:logistic booster
+            def predict_proba(row):
+                return float(booster.inplace_predict(row)[0])
+        else:
+            import joblib
+            model = joblib.load(MODEL_PATH)
+            # Trust the fitted model's own column order when it recorded one
+            columns = FEATURE_COLUMNS
+            if getattr(model, "feature_names_in_", None) is not None:
+                columns = list(model.feature_names_in_)
+            if hasattr(model, "set_params"):
+                model.set_params(n_jobs=1)
+            def predict_proba(row):
+                return float(model.predict_proba(row)[0][1])
+    except Exception as e:
+        print(f"Warning: Failed to load ML model from {MODEL_PATH}: {e}")
+        return None, None
+
+    return predict_proba, build_feature_layout(list(columns))
+
+RISK_TIERS = [
+    (80, "Critical - Immediate Service Required"),
+    (60, "High Risk - Schedule Service Soon"),
+    (40, "Moderate Risk - Monitor Closely"),
+    (20, "Low Risk - Routine Check Recommended"),
+]
+HEALTHY_RECOMMENDATION = "Healthy - No Immediate Action Needed"
+
+
+@app.on_event("shutdown")
+async def shutdown_ai_components():
+    if vehicle_ai:
+        vehicle_ai.cache.save()
+        await vehicle_ai.aclose()
 
 
 # Enable CORS for frontend integration
@@ -38,6 +165,8 @@ app.add_middleware(
 # --- Pydantic Schemas ---
 class ChatRequest(BaseModel):
     query: str
+    # Returned by the first reply; send it back to continue the same conversation
+    conversation_id: Optional[str] = None
 
 class RetrieveRequest(BaseModel):
     query: str
@@ -48,6 +177,21 @@ class PredictRequest(BaseModel):
     mileage: float
     vehicle_age: float
     reported_issues: int
+    engine_size: float
+    odometer_reading: float
+    insurance_premium: float
+    service_history: int
+    accident_history: int
+    fuel_efficiency: float
+    fuel_type: str
+    transmission_type: str
+    owner_type: str
+    tire_condition: str
+    brake_condition: str
+    battery_status: str
+    maintenance_history: str
+    days_since_last_service: int
+    warranty_remaining_days: int
 
 # --- Endpoints ---
 
@@ -63,38 +207,96 @@ def chat_endpoint(request: ChatRequest):
         raise HTTPException(status_code=503, detail="Vehicle AI is not initialized")
     
     try:
-        response = vehicle_ai.ask(request.query)
-        return {"response": response, "memory_length": len(vehicle_ai.memory)}
+        conversation_id, memory = get_conversation(request.conversation_id)
+        response = vehicle_ai.ask(request.query, memory=memory)
+        return {"response": response, "conversation_id": conversation_id, "memory_length": len(memory)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """Streams the Vehicle AI answer as server-sent events while it is generated."""
+    if not vehicle_ai:
+        raise HTTPException(status_code=503, detail="Vehicle AI is not initialized")
+
+    conversation_id, memory = get_conversation(request.conversation_id)
+
+    async def event_stream():
+        async for piece in vehicle_ai.ask_stream(request.query, memory=memory):
+            yield f"data: {json.dumps({'token': piece})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"X-Conversation-Id": conversation_id})
+
 @app.post("/api/retrieve")
-def retrieve_endpoint(request: RetrieveRequest):
+async def retrieve_endpoint(request: RetrieveRequest):
     """Endpoint for retrieving maintenance guidelines via RAG."""
     if not rag_retriever:
         raise HTTPException(status_code=503, detail="RAG Retriever is not initialized")
         
     try:
-        # Note: retriever.retrieve might print instead of returning cleanly,
-        # but based on the code it returns a list of strings
-        chunks = rag_retriever.retrieve(request.query, k=request.top_k)
+        # Concurrent requests are micro-batched into one encode + index search
+        chunks = await retrieval_batcher.retrieve(request.query, k=request.top_k)
         return {"query": request.query, "retrieved_chunks": chunks}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def build_feature_row(request: PredictRequest, layout: FeatureLayout):
+    """Encodes a request into the model's feature layout as a (1, n_features) array."""
+    # Fresh row per request keeps concurrent requests independent
+    row = np.zeros((1, layout.n_features), dtype=np.float32)
+    age, mileage = request.vehicle_age, request.mileage
+    row[0, layout.numeric_idx] = (
+        mileage, request.reported_issues, age, request.engine_size, request.odometer_reading,
+        request.insurance_premium, request.service_history, request.accident_history,
+        request.fuel_efficiency,
+        age * math.sqrt(age), mileage * age, request.reported_issues * mileage,
+        request.days_since_last_service, request.warranty_remaining_days,
+    )
+    categorical = {
+        "Vehicle_Model": request.vehicle_model,
+        "Maintenance_History": request.maintenance_history,
+        "Fuel_Type": request.fuel_type,
+        "Transmission_Type": request.transmission_type,
+        "Owner_Type": request.owner_type,
+        "Tire_Condition": request.tire_condition,
+        "Brake_Condition": request.brake_condition,
+        "Battery_Status": request.battery_status,
+    }
+    for col, value in categorical.items():
+        # Same normalisation as training: stripped, title-cased labels
+        idx = layout.category_idx[col].get(value.strip().title())
+        if idx is not None:
+            row[0, idx] = 1.0
+    return row
+
+def recommendation_for(risk_score):
+    for threshold, message in RISK_TIERS:
+        if risk_score >= threshold:
+            return message
+    return HEALTHY_RECOMMENDATION
+
 @app.post("/api/predict")
 def predict_endpoint(request: PredictRequest):
-    """Placeholder endpoint for ML risk prediction."""
-    # TODO: Load actual ML model and return real predictions
-    
-    # Dummy logic based on inputs
-    risk_score = min(100.0, request.vehicle_age * 5 + request.mileage / 1000 + request.reported_issues * 10)
-    recommendation = "Immediate Service Needed" if risk_score > 70 else "Routine Check"
-    
+    """Endpoint for ML maintenance-risk prediction."""
+    predict_proba, layout = get_model()
+    if predict_proba is None:
+        raise HTTPException(status_code=503, detail="ML model is not loaded")
+
+    try:
+        features = build_feature_row(request, layout)
+        # One ensemble pass: the class label follows from the probability
+        probability = predict_proba(features)
+        prediction = int(probability >= 0.5)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    risk_score = round(probability * 100, 2)
     return {
         "vehicle_model": request.vehicle_model,
-        "risk_score": round(risk_score, 2),
-        "recommendation": recommendation,
-        "note": "This is a placeholder prediction."
+        "needs_maintenance": bool(prediction),
+        "probability": round(probability, 4),
+        "risk_score": risk_score,
+        "recommendation": recommendation_for(risk_score),
     }
-
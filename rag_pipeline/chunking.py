@@ -1 +1,149 @@
-print('Performing recursive character chunking on manuals...')
+import os
+import csv
+import json
+import mmap
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# Curated maintenance guidance that is always part of the knowledge base
+MAINTENANCE_KNOWLEDGE = [
+    "Regular oil changes should be performed every 5,000 to 7,500 km, or every 6 months for conventional oil. Synthetic oil can extend the interval to 10,000-15,000 km.",
+    "Tire pressure should be checked monthly and before long trips. Most passenger vehicles need 30-35 PSI; check the door-jamb placard for the exact value.",
+    "Rotate tires every 8,000 to 10,000 km to even out tread wear. Replace tires when tread depth falls below 2/32 inch (1.6 mm).",
+    "Brake pads typically need replacement every 40,000 to 70,000 km. Squealing, grinding or a soft pedal are signs the brakes need inspection.",
+    "Brake fluid absorbs moisture over time and should be flushed every 2 years to keep braking performance consistent.",
+    "Battery life averages 3-5 years. Test battery voltage regularly; a resting voltage below 12.4 V indicates a weak battery that may fail to start the vehicle.",
+    "Coolant should be checked monthly and flushed every 50,000 to 100,000 km to prevent overheating and corrosion.",
+    "Automatic transmission fluid should be changed every 50,000 to 100,000 km. Manual transmissions typically need fluid every 50,000 to 80,000 km.",
+    "Replace the engine air filter every 20,000 to 30,000 km, or more often in dusty conditions, to protect fuel efficiency and engine power.",
+    "Spark plugs last 50,000 to 160,000 km depending on type. Misfires, rough idle and poor fuel efficiency are signs of worn plugs.",
+    "Timing belts must be replaced every 90,000 to 160,000 km. A failed timing belt can cause severe engine damage on interference engines.",
+    "Suspension components such as shocks and struts wear out around 80,000 to 100,000 km. Excessive bouncing or uneven tire wear indicates worn suspension.",
+    "High mileage vehicles require more frequent oil changes, cooling system checks and suspension inspections.",
+    "Electric vehicles need less routine maintenance but still require tire rotations, brake fluid changes, cabin filter replacement and battery health checks.",
+    "Warning lights on the dashboard should never be ignored. A flashing check-engine light indicates a misfire that needs immediate attention.",
+    "Vehicles with a history of accidents should have alignment, suspension and frame integrity inspected regularly.",
+]
+
+# Questions users ask all the time; their embeddings and top results are precomputed
+# with the index so the retriever can answer them without running the encoder
+CANONICAL_QUERIES = [
+    "When should I change the oil?",
+    "How often should I change the oil?",
+    "What tire pressure should I use?",
+    "When should I rotate my tires?",
+    "When do brake pads need replacing?",
+    "My brakes squeal, is that a problem?",
+    "How long does a car battery last?",
+    "How do I know if my battery is weak?",
+    "How often should coolant be flushed?",
+    "When should the timing belt be replaced?",
+    "What maintenance does a high mileage vehicle need?",
+    "What does a flashing check-engine light mean?",
+    "Explain the risk score.",
+]
+
+# Enriched CSV columns that make up a vehicle chunk
+ENRICHED_COLUMNS = (
+    "Vehicle_Model", "Vehicle_Age", "Mileage", "Reported_Issues", "risk_level",
+    "Tire_Condition", "Brake_Condition", "Battery_Status",
+    "vehicle_summary", "maintenance_recommendation",
+)
+# Fields are positional, in ENRICHED_COLUMNS order
+ENRICHED_TEMPLATE = (
+    "Vehicle: {0}, Age: {1} years, Mileage: {2} km, Issues: {3}, Risk: {4}. "
+    "Tire: {5}, Brake: {6}, Battery: {7}. {8} {9}"
+)
+
+
+def load_instruction_chunks(jsonl_path):
+    """
+    Loads instruction/response pairs from a JSONL file as "Q: ... A: ..." chunks.
+    """
+    # An empty file cannot be mapped
+    if not os.path.exists(jsonl_path) or os.path.getsize(jsonl_path) == 0:
+        return []
+
+    chunks = []
+    # Walk newline offsets in a read-only mapping; orjson parses each slice without a str decode
+    with open(jsonl_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start, size = 0, len(mm)
+        while start < size:
+            end = mm.find(b"\n", start)
+            if end == -1:
+                end = size
+            line = mm[start:end]
+            start = end + 1
+            if not line.strip():
+                continue
+            record = _loads(line)
+            question = f"{record.get('instruction', '')} {record.get('input', '')}".strip()
+            chunks.append(f"Q: {question}\nA: {record.get('output', '')}")
+    return chunks
+
+
+def load_enriched_chunks(csv_path, max_rows=500):
+    """
+    Loads per-vehicle descriptions from the enriched CSV (llm_data/text_enriched.csv).
+    """
+    if not os.path.exists(csv_path):
+        return []
+
+    chunks = []
+    # Plain rows indexed by column position; a large buffer keeps reads to a few syscalls
+    with open(csv_path, "r", newline="", encoding="utf-8", buffering=1 << 20) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return []
+        # Missing columns point at the "" appended to every row, matching row.get(..., "")
+        positions = [header.index(name) if name in header else -1 for name in ENRICHED_COLUMNS]
+        pick = itemgetter(*positions)
+        width = len(header)
+        for row in reader:
+            # Blank lines come back as [] (DictReader skipped them); they are not rows
+            if not row:
+                continue
+            if len(chunks) >= max_rows:
+                break
+            if len(row) < width:
+                row += [""] * (width - len(row))
+            row.append("")
+            chunks.append(ENRICHED_TEMPLATE.format(*pick(row)).strip())
+    return chunks
+
+
+def source_paths(project_root=None):
+    """
+    Data files the chunks are built from: (instruction JSONL, enriched CSV).
+    """
+    if project_root is None:
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return (os.path.join(project_root, "llm_data", "instruction_dataset.jsonl"),
+            os.path.join(project_root, "llm_data", "text_enriched.csv"))
+
+
+def get_all_chunks(project_root=None):
+    """
+    Collects every chunk for the RAG index: curated knowledge, the instruction
+    dataset and the enriched vehicle descriptions.
+    """
+    jsonl_path, csv_path = source_paths(project_root)
+
+    # The two files are independent; read and parse them concurrently
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        instructions = pool.submit(load_instruction_chunks, jsonl_path)
+        enriched = pool.submit(load_enriched_chunks, csv_path)
+        chunks = list(MAINTENANCE_KNOWLEDGE) + instructions.result() + enriched.result()
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+if __name__ == "__main__":
+    all_chunks = get_all_chunks()
+    print(f"Prepared {len(all_chunks)} chunks for indexing.")
@@ -3,12 +3,27 @@ Pytest configuration and shared fixtures for the Vehicle Maintenance Prediction
 """
 import os
 import sys
+import csv
+import json
 import pytest
-import tempfile
+
+try:
+    import orjson
+    _dumps = orjson.dumps
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj).encode("utf-8")
 
 # Add project root to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Column layout of the enriched CSV fixtures
+_ENRICHED_FIELDS = (
+    "vehicle_summary", "maintenance_recommendation", "Vehicle_Model",
+    "risk_level", "Mileage", "Vehicle_Age", "Tire_Condition",
+    "Brake_Condition", "Battery_Status", "Reported_Issues",
+)
+
 
 @pytest.fixture
 def sample_conversation_history():
@@ -21,9 +36,9 @@ def sample_conversation_history():
     ]
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_vehicle_data():
-    """Sample vehicle data for prediction tests."""
+    """Sample vehicle data for prediction tests. Shared: copy before modifying."""
     return {
         "vehicle_model": "Car",
         "mileage": 75000,
@@ -47,13 +62,6 @@ def sample_vehicle_data():
     }
 
 
-@pytest.fixture
-def temp_directory():
-    """Create a temporary directory for test files."""
-    with tempfile.TemporaryDirectory() as tmpdir:
-        yield tmpdir
-
-
 @pytest.fixture
 def sample_chunks():
     """Sample text chunks for RAG testing."""
@@ -66,9 +74,9 @@ def sample_chunks():
     ]
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_instruction_data():
-    """Sample instruction data for chunking tests."""
+    """Sample instruction data for chunking tests. Shared: do not modify."""
     return [
         {
             "instruction": "What maintenance is needed for high mileage vehicles?",
@@ -81,3 +89,29 @@ def sample_instruction_data():
             "output": "Brake pads should be replaced every 40,000 to 70,000 km depending on driving conditions."
         },
     ]
+
+
+@pytest.fixture(scope="session")
+def cached_instruction_jsonl(tmp_path_factory, sample_instruction_data):
+    """sample_instruction_data written once per session as a JSONL file; returns its path."""
+    path = tmp_path_factory.mktemp("instructions") / "instructions.jsonl"
+    path.write_bytes(b"\n".join(_dumps(record) for record in sample_instruction_data) + b"\n")
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def big_enriched_csv(tmp_path_factory):
+    """
+    Enriched CSV with 501 rows, one more than load_enriched_chunks' default
+    max_rows, written once per session; returns its path.
+    """
+    path = tmp_path_factory.mktemp("enriched") / "enriched.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(_ENRICHED_FIELDS)
+        writer.writerows(
+            [f"Summary {i}", f"Recommendation {i}", "Car", "High", str(i * 1000),
+             "8", "Worn Out", "Good", "Weak", "5"]
+            for i in range(501)
+        )
+    return str(path)
@@ -5,17 +5,23 @@ import pytest
 from unittest.mock import Mock, patch, MagicMock
 import sys
 import os
+import json
+import math
+from types import SimpleNamespace
+
+import numpy as np
 
 # Add project root to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def test_client():
-    """Create a TestClient for the FastAPI app."""
+    """Create one TestClient for the FastAPI app, shared by every test in the module."""
     from fastapi.testclient import TestClient
     from main import app
-    return TestClient(app)
+    with TestClient(app) as client:
+        yield client
 
 
 class TestHealthEndpoint:
@@ -46,22 +52,55 @@ class TestChatEndpoint:
         assert isinstance(data["response"], str)
 
     def test_chat_updates_memory(self, test_client):
-        """Test that chat endpoint updates memory."""
-        # First request
+        """Test that a conversation id continues the same conversation memory."""
+        # First request starts a conversation
         response1 = test_client.post(
             "/api/chat",
             json={"query": "First question"}
         )
+        conversation_id = response1.json()["conversation_id"]
         memory_len_1 = response1.json()["memory_length"]
         
-        # Second request
+        # Second request continues it
         response2 = test_client.post(
             "/api/chat",
-            json={"query": "Second question"}
+            json={"query": "Second question", "conversation_id": conversation_id}
         )
         memory_len_2 = response2.json()["memory_length"]
         
-        assert memory_len_2 >= memory_len_1
+        assert memory_len_1 == 2
+        assert memory_len_2 == 4
+        assert response2.json()["conversation_id"] == conversation_id
+
+    def test_chat_conversations_are_separate(self, test_client):
+        """Test that requests without a conversation id never share history."""
+        first = test_client.post("/api/chat", json={"query": "First question"}).json()
+        second = test_client.post("/api/chat", json={"query": "Second question"}).json()
+
+        assert first["conversation_id"] != second["conversation_id"]
+        assert second["memory_length"] == 2
+
+    def test_chat_repeat_question_hits_cache(self, test_client, monkeypatch):
+        """Test that the same opening question from a second client is served from the response cache."""
+        import main
+        monkeypatch.setenv("GROQ_API_KEY", "test_key")
+        monkeypatch.setattr("chatbot.vehicle_ai._httpx_available", True)
+        ai = main.VehicleAI(retriever=Mock(index=None))
+        ai._call_groq = Mock(return_value="Every 6 months.")
+        monkeypatch.setattr(main, "vehicle_ai", ai)
+
+        first = test_client.post("/api/chat", json={"query": "When should I change the oil?"})
+        second = test_client.post("/api/chat", json={"query": "when should I change the OIL?"})
+
+        assert first.json()["response"] == second.json()["response"] == "Every 6 months."
+        ai._call_groq.assert_called_once()
+
+    def test_chat_never_shows_rag_placeholder(self, test_client):
+        """Test that the RAG-unavailable placeholder is never presented as knowledge."""
+        response = test_client.post("/api/chat", json={"query": "When should I rotate my tires?"})
+
+        assert response.status_code == 200
+        assert "RAG index not available" not in response.json()["response"]
 
     def test_chat_missing_query(self, test_client):
         """Test chat endpoint with missing query."""
@@ -80,6 +119,44 @@ class TestChatEndpoint:
         assert response.status_code == 200
 
 
+class TestChatStreamEndpoint:
+    """Tests for the /api/chat/stream endpoint."""
+
+    def test_stream_sse_framing(self, test_client, monkeypatch):
+        """Test that each piece is one JSON-encoded SSE event, followed by [DONE]."""
+        import main
+
+        async def ask_stream(query, memory=None):
+            for piece in ("Change the ", 'oil "now"\n'):
+                yield piece
+
+        monkeypatch.setattr(main, "vehicle_ai", Mock(ask_stream=ask_stream))
+        response = test_client.post("/api/chat/stream", json={"query": "oil?"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = response.text.split("\n\n")
+        assert events[-2:] == ["data: [DONE]", ""]
+        tokens = [json.loads(event[len("data: "):])["token"] for event in events[:-2]]
+        assert tokens == ["Change the ", 'oil "now"\n']
+
+    def test_stream_rule_based_answer(self, test_client):
+        """Test that the default assistant streams a non-empty answer."""
+        response = test_client.post("/api/chat/stream", json={"query": "How often should I change the oil?"})
+
+        assert response.status_code == 200
+        assert response.headers["x-conversation-id"]
+        events = [event for event in response.text.split("\n\n") if event]
+        assert events[-1] == "data: [DONE]"
+        assert "".join(json.loads(event[len("data: "):])["token"] for event in events[:-1])
+
+    def test_stream_missing_query(self, test_client):
+        """Test stream endpoint with missing query."""
+        response = test_client.post("/api/chat/stream", json={})
+
+        assert response.status_code == 422
+
+
 class TestRetrieveEndpoint:
     """Tests for the /api/retrieve endpoint."""
 
@@ -97,6 +174,29 @@ class TestRetrieveEndpoint:
             assert "retrieved_chunks" in data
             assert data["query"] == "oil change"
 
+    def test_retrieve_batches_concurrent_requests(self, test_client, monkeypatch):
+        """Test that concurrent requests are answered from one batched retrieval."""
+        import asyncio
+        import main
+        from rag_pipeline.retriever import RetrievalBatcher
+
+        fake = Mock()
+        fake.retrieve_batch.side_effect = lambda queries, k: [[f"{q}:{j}" for j in range(k)] for q in queries]
+        monkeypatch.setattr(main, "rag_retriever", fake)
+        monkeypatch.setattr(main, "retrieval_batcher", RetrievalBatcher(fake, window_s=0.05))
+
+        async def run():
+            requests = [main.RetrieveRequest(query=q, top_k=k) for q, k in (("oil", 1), ("tires", 2))]
+            return await asyncio.gather(*(main.retrieve_endpoint(r) for r in requests))
+
+        results = asyncio.run(run())
+
+        fake.retrieve_batch.assert_called_once_with(["oil", "tires"], 2)
+        assert results == [
+            {"query": "oil", "retrieved_chunks": ["oil:0"]},
+            {"query": "tires", "retrieved_chunks": ["tires:0", "tires:1"]},
+        ]
+
     def test_retrieve_default_top_k(self, test_client):
         """Test retrieve endpoint uses default top_k."""
         response = test_client.post(
@@ -317,3 +417,147 @@ class TestAPIValidation:
         response = test_client.post("/api/predict", json=data)
         
         assert response.status_code in [200, 503]
+
+
+class StubBooster:
+    """Stands in for xgboost.Booster: records the rows it scores and returns a fixed probability."""
+    probability = 0.83
+    # Model's own column order, deliberately not FEATURE_COLUMNS order
+    feature_names = None
+
+    def __init__(self):
+        self.rows = []
+        self.params = {}
+
+    def load_model(self, path):
+        self.path = path
+
+    def set_param(self, params):
+        self.params.update(params)
+
+    def inplace_predict(self, row):
+        self.rows.append(row.copy())
+        return np.array([self.probability], dtype=np.float32)
+
+
+@pytest.fixture
+def stub_model(monkeypatch):
+    """Points main.get_model at a StubBooster through a fake xgboost module; yields the booster."""
+    import main
+    booster = StubBooster()
+    booster.feature_names = list(reversed(main.FEATURE_COLUMNS))
+    monkeypatch.setitem(sys.modules, "xgboost", SimpleNamespace(Booster=lambda: booster))
+    monkeypatch.setattr(main, "MODEL_PATH", "models/stub.ubj")
+    main.get_model.cache_clear()
+    yield booster
+    main.get_model.cache_clear()
+
+
+class TestFeatureRow:
+    """Tests for encoding a predict request into the model's feature layout."""
+
+    def test_feature_row_values_by_column(self, sample_vehicle_data):
+        """Test that numerics, engineered features and one-hot columns land in their columns."""
+        import main
+        layout = main.build_feature_layout(main.FEATURE_COLUMNS)
+
+        row = main.build_feature_row(main.PredictRequest(**sample_vehicle_data), layout)
+        values = dict(zip(main.FEATURE_COLUMNS, row[0]))
+
+        assert row.shape == (1, len(main.FEATURE_COLUMNS))
+        assert values["Mileage"] == 75000
+        assert values["Reported_Issues"] == 3
+        assert values["Vehicle_Age"] == 5
+        assert values["Engine_Size"] == 2000
+        assert values["Fuel_Efficiency"] == 15.0
+        assert values["aging_factor"] == pytest.approx(5 * math.sqrt(5))
+        assert values["mileage_age_interaction"] == 75000 * 5
+        assert values["issues_mileage_interaction"] == 3 * 75000
+        assert values["Days_Since_Last_Service"] == 180
+        assert values["Warranty_Remaining_Days"] == 365
+        # Baseline categories (Automatic, First, Good, Average) have no column of their own
+        one_hot = {col for col in main.FEATURE_COLUMNS[len(main.NUMERIC_FEATURES):] if values[col]}
+        assert one_hot == {"Vehicle_Model_Car", "Fuel_Type_Petrol"}
+
+    def test_feature_row_follows_model_column_order(self, sample_vehicle_data):
+        """Test that a model with its own column order gets each value at its column."""
+        import main
+        columns = list(reversed(main.FEATURE_COLUMNS))
+        data = dict(sample_vehicle_data, tire_condition=" worn out ", transmission_type="manual")
+
+        row = main.build_feature_row(main.PredictRequest(**data), main.build_feature_layout(columns))
+        values = dict(zip(columns, row[0]))
+
+        assert row[0, 0] == values["Battery_Status_Weak"] == 0
+        assert values["Mileage"] == 75000
+        assert values["Tire_Condition_Worn Out"] == 1
+        assert values["Transmission_Type_Manual"] == 1
+
+    def test_unknown_category_leaves_one_hots_empty(self, sample_vehicle_data):
+        """Test that an unseen category value encodes as the baseline."""
+        import main
+        layout = main.build_feature_layout(main.FEATURE_COLUMNS)
+        data = dict(sample_vehicle_data, vehicle_model="Tractor")
+
+        values = dict(zip(main.FEATURE_COLUMNS, main.build_feature_row(main.PredictRequest(**data), layout)[0]))
+
+        assert not any(values[col] for col in main.FEATURE_COLUMNS if col.startswith("Vehicle_Model_"))
+
+
+class TestRecommendation:
+    """Tests for mapping a risk score to a recommendation tier."""
+
+    @pytest.mark.parametrize("risk_score,expected", [
+        (100, "Critical - Immediate Service Required"),
+        (80, "Critical - Immediate Service Required"),
+        (79.99, "High Risk - Schedule Service Soon"),
+        (60, "High Risk - Schedule Service Soon"),
+        (59.99, "Moderate Risk - Monitor Closely"),
+        (40, "Moderate Risk - Monitor Closely"),
+        (39.99, "Low Risk - Routine Check Recommended"),
+        (20, "Low Risk - Routine Check Recommended"),
+        (19.99, "Healthy - No Immediate Action Needed"),
+        (0, "Healthy - No Immediate Action Needed"),
+    ])
+    def test_thresholds(self, risk_score, expected):
+        """Test that each tier starts at its threshold, inclusive."""
+        import main
+        assert main.recommendation_for(risk_score) == expected
+
+
+class TestPredictWithStubModel:
+    """Tests for /api/predict backed by a stub XGBoost booster."""
+
+    def test_get_model_loads_booster(self, stub_model):
+        """Test that a .ubj path loads a single-threaded booster in its own column order."""
+        import main
+        predict_proba, layout = main.get_model()
+
+        assert stub_model.path == "models/stub.ubj"
+        assert stub_model.params == {"nthread": 1}
+        assert layout.n_features == len(main.FEATURE_COLUMNS)
+        assert predict_proba(np.zeros((1, layout.n_features), dtype=np.float32)) == pytest.approx(0.83)
+
+    def test_predict_endpoint(self, test_client, stub_model, sample_vehicle_data):
+        """Test that the endpoint scores the encoded row and reports the matching tier."""
+        response = test_client.post("/api/predict", json=sample_vehicle_data)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["needs_maintenance"] is True
+        assert data["probability"] == 0.83
+        assert data["risk_score"] == 83.0
+        assert data["recommendation"] == "Critical - Immediate Service Required"
+        # The row was laid out in the booster's (reversed) column order
+        row = dict(zip(stub_model.feature_names, stub_model.rows[0][0]))
+        assert row["Mileage"] == 75000
+        assert row["Vehicle_Model_Car"] == 1
+
+    def test_predict_below_threshold(self, test_client, stub_model, sample_vehicle_data):
+        """Test that a low probability is reported as not needing maintenance."""
+        stub_model.probability = 0.1
+
+        data = test_client.post("/api/predict", json=sample_vehicle_data).json()
+
+        assert data["needs_maintenance"] is False
+        assert data["recommendation"] == "Healthy - No Immediate Action Needed"
@@ -0,0 +1,103 @@
+"""
+Unit tests for the pure helpers in the Streamlit dashboard (app.py).
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("plotly")
+
+import app
+from app import lttb_indices, downsample_trend
+
+
+class TestAIRespond:
+    """Tests for the dashboard chat's ai_respond intent matching."""
+
+    @pytest.mark.parametrize("message,expected", [
+        ("What happens if we keep delaying maintenance?", app.DELAY_RESPONSE),
+        ("Delay the maintenance of V-1001", app.DELAY_RESPONSE),
+        ("How costly is a breakdown?", app.COST_RESPONSE),
+        ("Give me the cost estimates", app.COST_RESPONSE),
+        ("Which vehicles are risky?", app.RISK_RESPONSE),
+        ("Show the risk scores", app.RISK_RESPONSE),
+    ])
+    def test_inflected_keywords(self, message, expected):
+        """Test that inflected and plural keywords reach their intent."""
+        assert app.ai_respond(message) == expected
+
+    def test_comparison_without_vehicles(self):
+        """Test that "comparison" asks for two vehicle ids."""
+        assert "specify two vehicles" in app.ai_respond("I want a comparison")
+
+    def test_compare_two_vehicles(self):
+        """Test that a comparison names both vehicles."""
+        response = app.ai_respond("Compare V-1001 and V-1005")
+        assert "V-1001 vs V-1005" in response
+
+    @pytest.mark.parametrize("message", ["Hi there", "hello"])
+    def test_greeting(self, message):
+        """Test that a greeting is answered with the introduction."""
+        assert app.ai_respond(message).startswith("👋")
+
+    @pytest.mark.parametrize("message", ["What is this?", "Which one is high?"])
+    def test_no_greeting_inside_words(self, message):
+        """Test that "hi" inside another word is not a greeting."""
+        assert app.ai_respond(message) == app.DEFAULT_RESPONSE
+
+
+class TestMockFleet:
+    """Tests for the mock fleet data."""
+
+    def test_base_fleet_survives_cache_expiry(self):
+        """Test that rebuilding the base fleet (as after its TTL) gives the same vehicles."""
+        first = app._build_base_fleet()
+        app._build_base_fleet.clear()
+
+        pd.testing.assert_frame_equal(app._build_base_fleet(), first)
+
+
+class TestLTTB:
+    """Tests for the trend-line downsampling helpers."""
+
+    @pytest.mark.parametrize("n,n_out", [(100, 10), (1001, 1000), (5000, 3), (37, 36)])
+    def test_exact_length_and_endpoints(self, n, n_out):
+        """Test that exactly n_out increasing indices are picked, first and last included."""
+        y = np.sin(np.linspace(0, 20, n))
+
+        idx = lttb_indices(np.arange(n), y, n_out)
+
+        assert len(idx) == n_out
+        assert idx[0] == 0 and idx[-1] == n - 1
+        assert np.all(np.diff(idx) > 0)
+
+    @pytest.mark.parametrize("n_out", [50, 80, 2])
+    def test_short_input_unchanged(self, n_out):
+        """Test that input no longer than the threshold (or a threshold under 3) keeps every point."""
+        idx = lttb_indices(np.arange(50), np.zeros(50), n_out)
+        assert list(idx) == list(range(50))
+
+    def test_keeps_spike(self):
+        """Test that a single outlier survives downsampling."""
+        y = np.zeros(1000)
+        y[417] = 10.0
+
+        assert 417 in lttb_indices(np.arange(1000), y, 20)
+
+    def test_downsample_trend(self):
+        """Test that a long daily trend is cut to max_points rows, keeping the first and last day."""
+        dates = pd.date_range("2020-01-01", periods=3000, freq="D")
+        df = pd.DataFrame({"Date": dates, "Average_Fleet_Risk": np.random.default_rng(0).random(3000)})
+
+        out = downsample_trend(df, max_points=500)
+
+        assert len(out) == 500
+        assert out["Date"].iloc[0] == dates[0] and out["Date"].iloc[-1] == dates[-1]
+
+    def test_downsample_trend_short_is_unchanged(self):
+        """Test that a trend within max_points is returned as is."""
+        df = pd.DataFrame({"Date": pd.date_range("2024-01-01", periods=30, freq="D"),
+                           "Average_Fleet_Risk": np.arange(30.0)})
+
+        assert downsample_trend(df, max_points=30) is df
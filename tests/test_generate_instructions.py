@@ -0,0 +1,48 @@
+"""
+Unit tests for the instruction dataset generator.
+"""
+import csv
+import pytest
+
+pytest.importorskip("pandas")
+
+from llm_data import generate_instructions
+
+
+@pytest.fixture
+def enriched_csv(tmp_path, monkeypatch):
+    """A 23-row enriched CSV in a temp working directory (the generator writes to ./llm_data)."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "llm_data").mkdir()
+    path = tmp_path / "enriched.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Vehicle_Model", "vehicle_summary", "maintenance_recommendation"])
+        writer.writerows(["Car", f"Summary {i}, with a comma", f"Recommendation {i}"] for i in range(23))
+    return str(path)
+
+
+def _generate(df_path, **kwargs):
+    generate_instructions.create_instruction_dataset(df_path, **kwargs)
+    with open("llm_data/instruction_dataset.jsonl") as f:
+        return f.read()
+
+
+class TestCreateInstructionDataset:
+    """Tests for create_instruction_dataset."""
+
+    def test_sharded_matches_serial(self, enriched_csv):
+        """Test that the parallel shard path writes exactly what a single chunk does."""
+        serial = _generate(enriched_csv, n_samples=100, chunksize=100)
+        # 23 rows / chunksize 4 = 6 shards, more than 2x one worker, so shards are written while reading
+        sharded = _generate(enriched_csv, n_samples=None, chunksize=4, max_workers=1)
+
+        assert sharded == serial
+        assert len(serial.splitlines()) == 23
+        assert '"input": "Summary 22, with a comma"' in serial.splitlines()[-1]
+
+    def test_shards_are_cleaned_up(self, enriched_csv, tmp_path):
+        """Test that no shard directory is left behind."""
+        _generate(enriched_csv, n_samples=None, chunksize=4, max_workers=2)
+
+        assert [p.name for p in (tmp_path / "llm_data").iterdir()] == ["instruction_dataset.jsonl"]
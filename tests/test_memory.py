@@ -4,13 +4,22 @@ Unit tests for the ConversationMemory module.
 import pytest
 from chatbot.memory import ConversationMemory
 
+_LARGE = "A" * 10000  # 10KB message
+_SPECIAL = "Test with special chars: @#$%^&*()_+=<>?/\\|{}[]"
+_UNICODE = "Testing unicode: 你好 مرحبا 🚗🔧"
+
+
+@pytest.fixture
+def memory():
+    """A ConversationMemory with the default max_turns."""
+    return ConversationMemory()
+
 
 class TestConversationMemory:
     """Tests for ConversationMemory class."""
 
-    def test_init_default_max_turns(self):
+    def test_init_default_max_turns(self, memory):
         """Test default initialization with max_turns=10."""
-        memory = ConversationMemory()
         assert memory.max_turns == 10
         assert len(memory.history) == 0
 
@@ -19,27 +28,24 @@ class TestConversationMemory:
         memory = ConversationMemory(max_turns=5)
         assert memory.max_turns == 5
 
-    def test_add_user_message(self):
+    def test_add_user_message(self, memory):
         """Test adding a user message."""
-        memory = ConversationMemory()
         memory.add("user", "Hello")
         
         assert len(memory) == 1
         assert memory.history[0]["role"] == "user"
         assert memory.history[0]["content"] == "Hello"
 
-    def test_add_assistant_message(self):
+    def test_add_assistant_message(self, memory):
         """Test adding an assistant message."""
-        memory = ConversationMemory()
         memory.add("assistant", "Hi there!")
         
         assert len(memory) == 1
         assert memory.history[0]["role"] == "assistant"
         assert memory.history[0]["content"] == "Hi there!"
 
-    def test_add_multiple_messages(self):
+    def test_add_multiple_messages(self, memory):
         """Test adding multiple messages."""
-        memory = ConversationMemory()
         memory.add("user", "Question 1")
         memory.add("assistant", "Answer 1")
         memory.add("user", "Question 2")
@@ -61,14 +67,12 @@ class TestConversationMemory:
         assert memory.history[0]["content"] == "Question 1"
         assert memory.history[-1]["content"] == "Answer 2"
 
-    def test_get_context_string_empty(self):
+    def test_get_context_string_empty(self, memory):
         """Test get_context_string with empty history."""
-        memory = ConversationMemory()
         assert memory.get_context_string() == ""
 
-    def test_get_context_string_with_messages(self):
+    def test_get_context_string_with_messages(self, memory):
         """Test get_context_string with messages."""
-        memory = ConversationMemory()
         memory.add("user", "What is oil change interval?")
         memory.add("assistant", "Every 5,000 to 7,500 km.")
         
@@ -76,9 +80,8 @@ class TestConversationMemory:
         assert "User: What is oil change interval?" in context
         assert "Assistant: Every 5,000 to 7,500 km." in context
 
-    def test_get_context_string_format(self):
+    def test_get_context_string_format(self, memory):
         """Test that context string uses proper formatting."""
-        memory = ConversationMemory()
         memory.add("user", "Hello")
         memory.add("assistant", "Hi")
         
@@ -88,20 +91,18 @@ class TestConversationMemory:
         assert lines[0].startswith("User:")
         assert lines[1].startswith("Assistant:")
 
-    def test_clear(self):
+    def test_clear(self, memory):
         """Test clearing the conversation history."""
-        memory = ConversationMemory()
         memory.add("user", "Test message")
         memory.add("assistant", "Test response")
         
         assert len(memory) == 2
         memory.clear()
         assert len(memory) == 0
-        assert memory.history == []
+        assert list(memory.history) == []
 
-    def test_len(self):
+    def test_len(self, memory):
         """Test __len__ method."""
-        memory = ConversationMemory()
         assert len(memory) == 0
         
         memory.add("user", "Test")
@@ -110,9 +111,8 @@ class TestConversationMemory:
         memory.add("assistant", "Response")
         assert len(memory) == 2
 
-    def test_with_sample_history(self, sample_conversation_history):
+    def test_with_sample_history(self, memory, sample_conversation_history):
         """Test memory with sample conversation history fixture."""
-        memory = ConversationMemory()
         for item in sample_conversation_history:
             memory.add(item["role"], item["content"])
         
@@ -135,26 +135,17 @@ class TestConversationMemory:
         assert memory.history[0]["content"] == "Q2"
         assert memory.history[1]["content"] == "A2"
 
-    def test_large_messages(self):
+    def test_large_messages(self, memory):
         """Test handling of large message content."""
-        memory = ConversationMemory()
-        large_content = "A" * 10000  # 10KB message
-        
-        memory.add("user", large_content)
-        assert memory.history[0]["content"] == large_content
+        memory.add("user", _LARGE)
+        assert memory.history[0]["content"] == _LARGE
 
-    def test_special_characters_in_messages(self):
+    def test_special_characters_in_messages(self, memory):
         """Test handling of special characters."""
-        memory = ConversationMemory()
-        special_content = "Test with special chars: @#$%^&*()_+=<>?/\\|{}[]"
-        
-        memory.add("user", special_content)
-        assert memory.history[0]["content"] == special_content
+        memory.add("user", _SPECIAL)
+        assert memory.history[0]["content"] == _SPECIAL
 
-    def test_unicode_messages(self):
+    def test_unicode_messages(self, memory):
         """Test handling of unicode characters."""
-        memory = ConversationMemory()
-        unicode_content = "Testing unicode: 你好 مرحبا 🚗🔧"
-        
-        memory.add("user", unicode_content)
-        assert memory.history[0]["content"] == unicode_content
+        memory.add("user", _UNICODE)
+        assert memory.history[0]["content"] == _UNICODE
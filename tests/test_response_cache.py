@@ -0,0 +1,177 @@
+"""
+Unit tests for the ResponseCache module.
+"""
+import sys
+import threading
+
+import pytest
+import numpy as np
+
+from chatbot import response_cache
+from chatbot.response_cache import ResponseCache
+
+# Unit embeddings: _NEAR is ~0.99 cosine to _OIL, _TIRES is orthogonal to both
+_OIL = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+_NEAR = np.array([0.99, 0.141, 0.0], dtype=np.float32)
+_TIRES = np.array([0.0, 0.0, 1.0], dtype=np.float32)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.time for the cache module; advance by setting clock.now."""
+    class Clock:
+        now = 1_000_000.0
+    monkeypatch.setattr(response_cache.time, "time", lambda: Clock.now)
+    return Clock
+
+
+class TestResponseCache:
+    """Tests for ResponseCache class."""
+
+    def test_exact_hit_ignores_case_and_whitespace(self):
+        """Test that questions differing only in case/whitespace share an entry."""
+        cache = ResponseCache()
+        cache.put("When should I change the oil?", "Every 6 months.")
+
+        assert cache.get("  when should I   CHANGE the oil? ") == "Every 6 months."
+
+    def test_miss_returns_none(self):
+        """Test that an unknown question without an embedding misses."""
+        cache = ResponseCache()
+        cache.put("When should I change the oil?", "Every 6 months.")
+
+        assert cache.get("How do I check tire pressure?") is None
+
+    def test_ttl_expiry(self, clock):
+        """Test that entries older than ttl_s are dropped on lookup."""
+        cache = ResponseCache(ttl_s=60)
+        cache.put("oil", "Every 6 months.", _OIL)
+
+        clock.now += 30
+        assert cache.get("oil") == "Every 6 months."
+
+        clock.now += 31
+        assert cache.get("oil") is None
+        assert len(cache) == 0
+
+    def test_ttl_expiry_on_semantic_hit(self, clock):
+        """Test that an expired entry is not served through the embedding path either."""
+        cache = ResponseCache(ttl_s=60)
+        cache.put("oil", "Every 6 months.", _OIL)
+
+        clock.now += 61
+        assert cache.get("motor oil", _NEAR) is None
+        assert len(cache) == 0
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted past max_entries."""
+        cache = ResponseCache(max_entries=2)
+        cache.put("first", "1")
+        cache.put("second", "2")
+        cache.get("first")  # "second" is now least recently used
+        cache.put("third", "3")
+
+        assert len(cache) == 2
+        assert cache.get("second") is None
+        assert cache.get("first") == "1"
+        assert cache.get("third") == "3"
+
+    def test_semantic_hit_and_miss(self):
+        """Test that a near-duplicate embedding hits and an unrelated one misses."""
+        cache = ResponseCache(threshold=0.95)
+        cache.put("When should I change the oil?", "Every 6 months.", _OIL)
+
+        assert cache.get("How often is an oil change due?", _NEAR) == "Every 6 months."
+        assert cache.get("What tire pressure should I use?", _TIRES) is None
+
+    def test_context_is_part_of_the_key(self):
+        """Test that an entry only matches lookups with the same conversation context."""
+        cache = ResponseCache()
+        cache.put("what about the second one?", "Semi-metallic.", _OIL, context="user: brake pads?")
+
+        assert cache.get("What about the second one?", context="user: brake pads?") == "Semi-metallic."
+        assert cache.get("What about the second one?") is None
+        assert cache.get("What about the second one?", _OIL, context="user: tires?") is None
+        assert cache.get("about the second one", _NEAR, context="user: brake pads?") == "Semi-metallic."
+
+    def test_semantic_lookup_sees_new_entries(self):
+        """Test that entries added after a lookup are included in the next one."""
+        cache = ResponseCache()
+        cache.put("oil", "Every 6 months.", _OIL)
+        assert cache.get("tire pressure", _TIRES) is None
+
+        cache.put("tires", "32 PSI.", _TIRES)
+        assert cache.get("tire pressure", _TIRES) == "32 PSI."
+
+    def test_save_load_roundtrip(self, tmp_path):
+        """Test that saved entries, embeddings included, are restored by a new cache."""
+        pytest.importorskip("joblib")
+        path = str(tmp_path / "responses.joblib")
+        cache = ResponseCache(path=path)
+        cache.put("oil", "Every 6 months.", _OIL)
+        cache.save()
+
+        restored = ResponseCache(path=path)
+
+        assert restored.get("oil") == "Every 6 months."
+        assert restored.get("motor oil", _NEAR) == "Every 6 months."
+
+    def test_load_respects_max_entries(self, tmp_path, clock):
+        """Test that loading a larger saved cache keeps only the newest max_entries."""
+        pytest.importorskip("joblib")
+        path = str(tmp_path / "responses.joblib")
+        cache = ResponseCache()
+        for i in range(5):
+            clock.now += 1
+            cache.put(f"question {i}", str(i))
+        cache.save(path)
+
+        restored = ResponseCache(max_entries=2, path=path)
+
+        assert len(restored) == 2
+        assert restored.get("question 4") == "4"
+        assert restored.get("question 0") is None
+
+    def test_clear(self):
+        """Test that clear empties the cache."""
+        cache = ResponseCache()
+        cache.put("oil", "Every 6 months.", _OIL)
+        cache.clear()
+
+        assert len(cache) == 0
+        assert cache.get("oil", _OIL) is None
+
+    def test_concurrent_get_and_put(self):
+        """Test that lookups rebuilding the embedding matrix survive concurrent puts."""
+        cache = ResponseCache(max_entries=200)
+        errors = []
+
+        def writer(offset):
+            try:
+                for i in range(300):
+                    cache.put(f"question {offset} {i}", "answer", _OIL)
+            except Exception as e:
+                errors.append(e)
+
+        def reader():
+            try:
+                for _ in range(300):
+                    cache.get("unrelated question", _TIRES)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(2)]
+        threads += [threading.Thread(target=reader) for _ in range(2)]
+        # Switch threads as often as possible so an unguarded race shows up
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+        assert errors == []
+        assert len(cache) == 200
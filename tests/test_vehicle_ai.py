@@ -2,85 +2,152 @@
 Unit tests for the VehicleAI chatbot module.
 """
 import os
+import json
+import asyncio
+import pytest
+from contextlib import asynccontextmanager
 from unittest.mock import Mock, patch, MagicMock
 
+import httpx
+
+from chatbot.memory import ConversationMemory
+from chatbot.vehicle_ai import VehicleAI, LLM_ERROR_PREFIX
+
+# One xdist worker for this file, so the module-scoped VehicleAI is built once (-n auto --dist loadgroup)
+pytestmark = pytest.mark.xdist_group("vehicle_ai")
+
+_SYS_PROMPT_LC = VehicleAI.SYSTEM_PROMPT.lower()
+_LONG_CHUNK = "A" * 500  # More than 300 chars
+
+
+def _groq_event(content):
+    return "data: " + json.dumps({"choices": [{"delta": {"content": content}}]})
+
+
+def _fake_stream(lines, fail_after=None):
+    """Replacement for httpx.AsyncClient.stream that replays SSE lines, optionally dropping the connection."""
+    @asynccontextmanager
+    async def stream(self, method, url, **kwargs):
+        async def aiter_lines():
+            for i, line in enumerate(lines):
+                if i == fail_after:
+                    raise httpx.ReadError("connection dropped")
+                yield line
+
+        resp = Mock()
+        resp.aiter_lines = aiter_lines
+        yield resp
+    return stream
+
+
+async def _collect(agen):
+    return [piece async for piece in agen]
+
+
+@pytest.fixture(autouse=True)
+def _clean_env(monkeypatch):
+    """Run every test without API keys or a persisted response cache; tests opt in with setenv."""
+    for key in ("GROQ_API_KEY", "HF_TOKEN", "RESPONSE_CACHE_PATH"):
+        monkeypatch.delenv(key, raising=False)
+
+
+@pytest.fixture(scope="module")
+def rule_based_ai():
+    """One rule-based VehicleAI (no API keys, no retriever) shared by the module."""
+    with patch.dict(os.environ, {}, clear=True):
+        ai = VehicleAI()
+    ai._retriever = None
+    ai._retriever_initialized = True
+    return ai
+
+
+@pytest.fixture
+def mock_retriever():
+    """A retriever double that returns two chunks; tests override retrieve as needed."""
+    retriever = Mock()
+    retriever.retrieve.return_value = ["Chunk 1", "Chunk 2"]
+    return retriever
+
+
+@pytest.fixture
+def groq_ai(monkeypatch):
+    """A Groq-backed VehicleAI without a retriever; tests patch httpx.AsyncClient.stream."""
+    monkeypatch.setenv("GROQ_API_KEY", "test_key")
+    monkeypatch.setattr("chatbot.vehicle_ai._httpx_available", True)
+    ai = VehicleAI()
+    ai._retriever = None
+    ai._retriever_initialized = True
+    yield ai
+    asyncio.run(ai.aclose())
+
+
+@pytest.fixture
+def ai(rule_based_ai):
+    """The shared rule-based VehicleAI with its conversation memory cleared."""
+    rule_based_ai.memory.clear()
+    return rule_based_ai
+
 
 class TestVehicleAIInit:
     """Tests for VehicleAI initialization."""
 
     def test_init_creates_memory(self):
         """Test that initialization creates a ConversationMemory instance."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            assert ai.memory is not None
-            assert len(ai.memory) == 0
-
-    def test_init_rule_based_backend_no_keys(self):
-        """Test that rule-based backend is used when no API keys are set."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {"GROQ_API_KEY": "", "HF_TOKEN": ""}, clear=True):
-            ai = VehicleAI()
-            assert ai.backend == "rule-based"
-
-    def test_init_groq_backend_with_key(self):
-        """Test that Groq backend is used when GROQ_API_KEY is set."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {"GROQ_API_KEY": "test_key"}, clear=True):
-            ai = VehicleAI()
-            assert ai.backend == "groq"
-
-    def test_init_huggingface_backend_with_token(self):
-        """Test that HuggingFace backend is used when HF_TOKEN is set."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {"HF_TOKEN": "test_token", "GROQ_API_KEY": ""}, clear=True):
-            ai = VehicleAI()
-            assert ai.backend == "huggingface"
-
-    def test_init_with_custom_retriever(self):
+        ai = VehicleAI()
+        assert ai.memory is not None
+        assert len(ai.memory) == 0
+
+    @pytest.mark.parametrize("env,expected", [
+        ({"GROQ_API_KEY": "", "HF_TOKEN": ""}, "rule-based"),
+        ({"GROQ_API_KEY": "test_key"}, "groq"),
+        ({"HF_TOKEN": "test_token", "GROQ_API_KEY": ""}, "huggingface"),
+    ])
+    def test_init_backend_selection(self, monkeypatch, env, expected):
+        """Test that the backend follows the configured API keys (Groq first, then HuggingFace)."""
+        for key, value in env.items():
+            if value:
+                monkeypatch.setenv(key, value)
+        ai = VehicleAI()
+        assert ai.backend == expected
+
+    def test_init_with_custom_retriever(self, mock_retriever):
         """Test initialization with a custom retriever."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        mock_retriever = Mock()
         ai = VehicleAI(retriever=mock_retriever)
         
         assert ai._retriever == mock_retriever
         assert ai._retriever_initialized is True
 
+    def test_init_drops_retriever_without_index(self, mock_retriever):
+        """Test that an injected retriever without an index is not used for context."""
+        mock_retriever.index = None
+        ai = VehicleAI(retriever=mock_retriever)
+
+        assert ai.retriever is None
+        ai.ask("Test question")
+        mock_retriever.retrieve.assert_not_called()
+
     def test_system_prompt_defined(self):
         """Test that SYSTEM_PROMPT is properly defined."""
-        from chatbot.vehicle_ai import VehicleAI
-        
         assert hasattr(VehicleAI, "SYSTEM_PROMPT")
-        assert "vehicle maintenance" in VehicleAI.SYSTEM_PROMPT.lower()
+        assert "vehicle maintenance" in _SYS_PROMPT_LC
 
 
 class TestVehicleAIRetrieverProperty:
     """Tests for VehicleAI retriever lazy initialization."""
 
-    def test_retriever_lazy_init(self):
+    def test_retriever_lazy_init(self, monkeypatch):
         """Test that retriever is lazily initialized on first access."""
-        from chatbot.vehicle_ai import VehicleAI
+        monkeypatch.setattr("chatbot.vehicle_ai._rag_available", False)
+        ai = VehicleAI()
+        assert ai._retriever_initialized is False
         
-        with patch.dict(os.environ, {}, clear=True):
-            with patch('chatbot.vehicle_ai._rag_available', False):
-                ai = VehicleAI()
-                assert ai._retriever_initialized is False
-                
-                # Access retriever property
-                _ = ai.retriever
-                
-                assert ai._retriever_initialized is True
-
-    def test_retriever_reuses_existing(self):
-        """Test that retriever property doesn't reinitialize if already set."""
-        from chatbot.vehicle_ai import VehicleAI
+        # Access retriever property
+        _ = ai.retriever
         
-        mock_retriever = Mock()
+        assert ai._retriever_initialized is True
+
+    def test_retriever_reuses_existing(self, mock_retriever):
+        """Test that retriever property doesn't reinitialize if already set."""
         ai = VehicleAI(retriever=mock_retriever)
         
         # Access multiple times
@@ -93,268 +160,367 @@ class TestVehicleAIRetrieverProperty:
 class TestVehicleAIAsk:
     """Tests for VehicleAI ask method."""
 
-    def test_ask_adds_messages_to_memory(self):
-        """Test that asking a question adds messages to memory."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            ai._retriever = None
-            ai._retriever_initialized = True
-            
-            initial_len = len(ai.memory)
-            ai.ask("What is the oil change interval?")
-            
-            assert len(ai.memory) == initial_len + 2  # user + assistant
-
-    def test_ask_returns_string(self):
-        """Test that ask returns a string response."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            ai._retriever = None
-            ai._retriever_initialized = True
-            
-            response = ai.ask("Test question?")
-            assert isinstance(response, str)
-            assert len(response) > 0
-
-    def test_ask_uses_retriever_when_available(self):
+    def test_ask_uses_retriever_when_available(self, mock_retriever):
         """Test that ask uses the retriever to get context."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        mock_retriever = Mock()
-        mock_retriever.retrieve.return_value = ["Chunk 1", "Chunk 2"]
+        ai = VehicleAI(retriever=mock_retriever)
+        ai.ask("Test question")
         
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI(retriever=mock_retriever)
-            ai.ask("Test question")
-            
-            mock_retriever.retrieve.assert_called_once()
+        mock_retriever.retrieve.assert_called_once()
 
-    def test_ask_handles_retriever_exception(self):
+    def test_ask_handles_retriever_exception(self, mock_retriever):
         """Test that ask handles retriever exceptions gracefully."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        mock_retriever = Mock()
         mock_retriever.retrieve.side_effect = Exception("Retriever error")
         
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI(retriever=mock_retriever)
-            
-            # Should not raise, should fall back gracefully
-            response = ai.ask("Test question")
-            assert isinstance(response, str)
+        ai = VehicleAI(retriever=mock_retriever)
+        
+        # Should not raise, should fall back gracefully
+        response = ai.ask("Test question")
+        assert isinstance(response, str)
 
 
 class TestVehicleAIBuildPrompt:
     """Tests for VehicleAI _build_prompt method."""
 
-    def test_build_prompt_includes_system_prompt(self):
+    def test_build_prompt_includes_system_prompt(self, ai):
         """Test that prompt includes the system prompt."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            prompt = ai._build_prompt("Test question", [])
-            
-            assert VehicleAI.SYSTEM_PROMPT in prompt
+        prompt = ai._build_prompt("Test question", [])
 
-    def test_build_prompt_includes_context_chunks(self):
+        assert VehicleAI.SYSTEM_PROMPT in prompt
+
+    def test_build_prompt_includes_context_chunks(self, ai):
         """Test that prompt includes context chunks when provided."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            chunks = ["Chunk 1 content", "Chunk 2 content"]
-            
-            prompt = ai._build_prompt("Test question", chunks)
-            
-            assert "Chunk 1 content" in prompt
-            assert "Chunk 2 content" in prompt
-            assert "Relevant Knowledge" in prompt
-
-    def test_build_prompt_includes_question(self):
+        chunks = ["Chunk 1 content", "Chunk 2 content"]
+
+        prompt = ai._build_prompt("Test question", chunks)
+
+        assert "Chunk 1 content" in prompt
+        assert "Chunk 2 content" in prompt
+        assert "Relevant Knowledge" in prompt
+
+    def test_build_prompt_keeps_chunk_order(self, ai):
+        """Test that knowledge chunks keep retrieval order and repeats are dropped."""
+        chunks = ["Most relevant", "Another chunk", "Most relevant", "Least relevant"]
+
+        prompt = ai._build_prompt("Test question", chunks)
+
+        assert "- Most relevant\n- Another chunk\n- Least relevant\n" in prompt
+        assert prompt.count("Most relevant") == 1
+
+    def test_build_prompt_drops_lowest_ranked_chunks_over_budget(self, ai, monkeypatch):
+        """Test that chunks over PROMPT_TOKEN_BUDGET are dropped from the least relevant end."""
+        from chatbot.vehicle_ai import estimate_tokens
+        question = "Test question"
+        chunks = [f"Chunk {i} " + "x" * 92 for i in range(4)]  # 100 chars, 26 tokens each
+        # Room for the system prompt, empty history, question and two and a half chunks
+        budget = VehicleAI._SYSTEM_TOKENS + estimate_tokens("") + estimate_tokens(question) + 65
+        monkeypatch.setattr("chatbot.vehicle_ai.PROMPT_TOKEN_BUDGET", budget)
+
+        assert ai._fit_chunks(question, chunks, "") == chunks[:2]
+        prompt = ai._build_prompt(question, chunks)
+        assert "Chunk 0" in prompt and "Chunk 1" in prompt
+        assert "Chunk 2" not in prompt and "Chunk 3" not in prompt
+
+    def test_build_prompt_history_shrinks_chunk_budget(self, ai, monkeypatch):
+        """Test that conversation history counts against the chunk budget."""
+        from chatbot.vehicle_ai import estimate_tokens
+        chunks = ["Chunk " + "x" * 94]  # 26 tokens
+        budget = VehicleAI._SYSTEM_TOKENS + estimate_tokens("") + estimate_tokens("Q") + 30
+        monkeypatch.setattr("chatbot.vehicle_ai.PROMPT_TOKEN_BUDGET", budget)
+        assert ai._fit_chunks("Q", chunks, "") == chunks
+
+        ai.memory.add("user", "y" * 40)
+
+        assert "Chunk" not in ai._build_prompt("Q", chunks)
+
+    def test_build_prompt_drops_oldest_history_over_budget(self, ai, monkeypatch):
+        """Test that history over PROMPT_TOKEN_BUDGET loses its oldest turns before any chunk is added."""
+        from chatbot.vehicle_ai import estimate_tokens
+        question = "Test question"
+        for i in range(6):
+            ai.memory.add("user", f"Turn {i} " + "y" * 90)
+        # Room for the system prompt, the question and about three turns
+        budget = VehicleAI._SYSTEM_TOKENS + estimate_tokens(question) + 85
+        monkeypatch.setattr("chatbot.vehicle_ai.PROMPT_TOKEN_BUDGET", budget)
+
+        prompt = ai._build_prompt(question, ["Chunk 0 " + "x" * 40])
+        history = prompt.split("### Conversation History\n")[1].split("\n\n")[0]
+
+        assert len(history.splitlines()) == 3
+        assert "Turn 0" not in prompt and "Turn 2" not in prompt
+        assert "Turn 3" in prompt and "Turn 5" in prompt
+        assert "Chunk 0" not in prompt
+        assert VehicleAI._SYSTEM_TOKENS + estimate_tokens(history) + estimate_tokens(question) <= budget
+
+    def test_build_prompt_includes_question(self, ai):
         """Test that prompt includes the user's question."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            question = "What is the oil change interval?"
-            
-            prompt = ai._build_prompt(question, [])
-            
-            assert question in prompt
-
-    def test_build_prompt_includes_history(self):
+        question = "What is the oil change interval?"
+
+        prompt = ai._build_prompt(question, [])
+
+        assert question in prompt
+
+    def test_build_prompt_includes_history(self, ai):
         """Test that prompt includes conversation history."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            ai.memory.add("user", "Previous question")
-            ai.memory.add("assistant", "Previous answer")
-            
-            prompt = ai._build_prompt("New question", [])
-            
-            assert "Previous question" in prompt
-            assert "Previous answer" in prompt
+        ai.memory.add("user", "Previous question")
+        ai.memory.add("assistant", "Previous answer")
+
+        prompt = ai._build_prompt("New question", [])
+
+        assert "Previous question" in prompt
+        assert "Previous answer" in prompt
 
 
 class TestVehicleAIRuleBasedResponse:
     """Tests for VehicleAI _rule_based_response method."""
 
-    def test_rule_based_with_chunks(self):
+    def test_rule_based_with_chunks(self, ai):
         """Test rule-based response when context chunks are available."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            chunks = ["Oil changes every 5000 km"]
-            
-            response = ai._rule_based_response("oil change", chunks)
-            
-            assert "knowledge base" in response.lower()
-            assert "5000" in response
-
-    def test_rule_based_without_chunks(self):
+        chunks = ["Oil changes every 5000 km"]
+
+        response = ai._rule_based_response("oil change", chunks)
+
+        assert "knowledge base" in response.lower()
+        assert "5000" in response
+
+    def test_rule_based_without_chunks(self, ai):
         """Test rule-based response when no context chunks available."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            
-            response = ai._rule_based_response("test question", [])
-            
-            assert "vehicle maintenance" in response.lower()
-
-    def test_rule_based_risk_keywords(self):
+        response = ai._rule_based_response("test question", [])
+
+        assert "vehicle maintenance" in response.lower()
+
+    def test_rule_based_risk_keywords(self, ai):
         """Test that risk-related keywords trigger specific advice."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            chunks = ["Some context"]
-            
-            response = ai._rule_based_response("What is my risk score?", chunks)
-            
-            assert "XGBoost" in response or "risk factors" in response.lower()
-
-    def test_rule_based_brake_keywords(self):
+        chunks = ["Some context"]
+
+        response = ai._rule_based_response("What is my risk score?", chunks)
+
+        assert "XGBoost" in response or "risk factors" in response.lower()
+
+    def test_rule_based_brake_keywords(self, ai):
         """Test that brake-related keywords trigger specific advice."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            chunks = ["Some context about brakes"]
-            
-            response = ai._rule_based_response("My brakes are worn", chunks)
-            
-            assert "safety" in response.lower() or "inspect" in response.lower()
-
-    def test_rule_based_truncates_long_chunks(self):
+        chunks = ["Some context about brakes"]
+
+        response = ai._rule_based_response("My brakes are worn", chunks)
+
+        assert "safety" in response.lower() or "inspect" in response.lower()
+
+    def test_rule_based_truncates_long_chunks(self, ai):
         """Test that long chunks are truncated in response."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            long_chunk = "A" * 500  # More than 300 chars
-            
-            response = ai._rule_based_response("test", [long_chunk])
-            
-            assert "..." in response
+        response = ai._rule_based_response("test", [_LONG_CHUNK])
+
+        assert "..." in response
 
 
 class TestVehicleAILLMBackends:
     """Tests for VehicleAI LLM API backend methods."""
 
-    def test_call_groq_falls_back_without_httpx(self):
-        """Test that Groq call falls back when httpx is unavailable."""
-        from chatbot.vehicle_ai import VehicleAI
+    @pytest.mark.parametrize("env,method", [
+        ({"GROQ_API_KEY": "test_key"}, "_call_groq"),
+        ({"HF_TOKEN": "test_token"}, "_call_huggingface"),
+    ])
+    def test_backend_falls_back_without_httpx(self, monkeypatch, env, method):
+        """Test that the Groq and HuggingFace calls fall back when httpx is unavailable."""
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        monkeypatch.setattr("chatbot.vehicle_ai._httpx_available", False)
+        ai = VehicleAI()
+        ai._retriever = None
+        ai._retriever_initialized = True
         
-        with patch.dict(os.environ, {"GROQ_API_KEY": "test_key"}, clear=True):
-            with patch('chatbot.vehicle_ai._httpx_available', False):
-                ai = VehicleAI()
-                ai._retriever = None
-                ai._retriever_initialized = True
-                
-                response = ai._call_groq("test question", [])
-                
-                # Should return rule-based response
-                assert isinstance(response, str)
-
-    def test_call_huggingface_falls_back_without_httpx(self):
-        """Test that HuggingFace call falls back when httpx is unavailable."""
-        from chatbot.vehicle_ai import VehicleAI
+        response = getattr(ai, method)("test question", [])
         
-        with patch.dict(os.environ, {"HF_TOKEN": "test_token", "GROQ_API_KEY": ""}, clear=True):
-            with patch('chatbot.vehicle_ai._httpx_available', False):
-                ai = VehicleAI()
-                ai._retriever = None
-                ai._retriever_initialized = True
-                
-                response = ai._call_huggingface("test question", [])
-                
-                # Should return rule-based response
-                assert isinstance(response, str)
-
-    def test_call_groq_handles_api_error(self):
+        # Should return rule-based response
+        assert isinstance(response, str)
+
+    def test_call_groq_handles_api_error(self, monkeypatch):
         """Test that Groq handles API errors gracefully."""
-        from chatbot.vehicle_ai import VehicleAI
+        monkeypatch.setenv("GROQ_API_KEY", "test_key")
+        monkeypatch.setattr("chatbot.vehicle_ai._httpx_available", True)
+        mock_httpx = MagicMock()
+        mock_httpx.Client.return_value.post.side_effect = Exception("API Error")
+        monkeypatch.setattr("chatbot.vehicle_ai.httpx", mock_httpx)
         
-        with patch.dict(os.environ, {"GROQ_API_KEY": "test_key"}, clear=True):
-            with patch('chatbot.vehicle_ai._httpx_available', True):
-                with patch('chatbot.vehicle_ai.httpx') as mock_httpx:
-                    mock_client = MagicMock()
-                    mock_client.__enter__ = Mock(return_value=mock_client)
-                    mock_client.__exit__ = Mock(return_value=False)
-                    mock_client.post.side_effect = Exception("API Error")
-                    mock_httpx.Client.return_value = mock_client
-                    
-                    ai = VehicleAI()
-                    ai._retriever = None
-                    ai._retriever_initialized = True
-                    
-                    response = ai._call_groq("test question", [])
-                    
-                    assert "error" in response.lower() or "knowledge base" in response.lower()
+        ai = VehicleAI()
+        ai._retriever = None
+        ai._retriever_initialized = True
+        
+        response = ai._call_groq("test question", [])
+        
+        mock_httpx.Client.return_value.post.assert_called_once()
+        assert "error" in response.lower() or "knowledge base" in response.lower()
+
+
+class TestVehicleAIStreaming:
+    """Tests for VehicleAI ask_stream."""
+
+    def test_clean_stream(self, groq_ai, monkeypatch):
+        """Test that a complete stream is yielded piece by piece, remembered and cached."""
+        lines = [_groq_event("Change the "), "", ": keep-alive", _groq_event("oil every 6 months."), "data: [DONE]"]
+        monkeypatch.setattr(httpx.AsyncClient, "stream", _fake_stream(lines))
+
+        pieces = asyncio.run(_collect(groq_ai.ask_stream("When should I change the oil?")))
+
+        assert pieces == ["Change the ", "oil every 6 months."]
+        assert groq_ai.memory.history[-1]["content"] == "Change the oil every 6 months."
+        assert groq_ai.cache.get("When should I change the oil?") == "Change the oil every 6 months."
+
+    def test_stream_huggingface_skips_special_tokens(self, groq_ai, monkeypatch):
+        """Test that HuggingFace token events are extracted and special tokens dropped."""
+        groq_ai.backend = "huggingface"
+        lines = ["data: " + json.dumps({"token": {"text": text, "special": special}})
+                 for text, special in (("Every ", False), ("6 months.", False), ("</s>", True))]
+        monkeypatch.setattr(httpx.AsyncClient, "stream", _fake_stream(lines))
+
+        pieces = asyncio.run(_collect(groq_ai.ask_stream("When should I change the oil?")))
+
+        assert pieces == ["Every ", "6 months."]
+
+    def test_stream_failing_before_any_token_falls_back(self, groq_ai, monkeypatch):
+        """Test that a stream failing before its first token yields the flagged fallback."""
+        monkeypatch.setattr(httpx.AsyncClient, "stream", _fake_stream([_groq_event("Hi")], fail_after=0))
+
+        pieces = asyncio.run(_collect(groq_ai.ask_stream("When should I change the oil?")))
+
+        assert len(pieces) == 1
+        assert pieces[0].startswith(LLM_ERROR_PREFIX)
+        assert len(groq_ai.cache) == 0
+
+    def test_stream_failing_partway_is_not_cached(self, groq_ai, monkeypatch):
+        """Test that a truncated stream is kept in memory but never cached."""
+        lines = [_groq_event("Change the "), _groq_event("oil every"), _groq_event(" 6 months.")]
+        monkeypatch.setattr(httpx.AsyncClient, "stream", _fake_stream(lines, fail_after=2))
+
+        pieces = asyncio.run(_collect(groq_ai.ask_stream("When should I change the oil?")))
+
+        assert pieces == ["Change the ", "oil every"]
+        assert len(groq_ai.cache) == 0
+        assert groq_ai.memory.history[-1]["content"] == "Change the oil every"
+
+    def test_empty_stream_is_not_cached(self, groq_ai, monkeypatch):
+        """Test that a stream that produced no text is not cached as an empty answer."""
+        monkeypatch.setattr(httpx.AsyncClient, "stream", _fake_stream(["data: [DONE]"]))
+
+        asyncio.run(_collect(groq_ai.ask_stream("When should I change the oil?")))
+
+        assert len(groq_ai.cache) == 0
+
+
+class TestVehicleAIResponseCache:
+    """Tests for when VehicleAI consults the response cache."""
+
+    def test_answer_cached_at_conversation_start(self, groq_ai):
+        """Test that an LLM answer to an opening question is cached and reused."""
+        groq_ai._call_groq = Mock(return_value="Every 6 months.")
+
+        groq_ai.ask("When should I change the oil?")
+        groq_ai.memory.clear()
+        assert groq_ai.ask("When should I change the oil?") == "Every 6 months."
+
+        groq_ai._call_groq.assert_called_once()
+
+    def test_follow_up_keyed_on_history(self, groq_ai):
+        """Test that a follow-up only hits entries cached under the same history."""
+        groq_ai.cache.put("what about the second one?", "From another conversation.")
+        groq_ai._call_groq = Mock(return_value="Semi-metallic pads last longer.")
+
+        def brake_conversation():
+            memory = ConversationMemory()
+            memory.add("user", "Which brake pads do you recommend?")
+            memory.add("assistant", "Ceramic or semi-metallic.")
+            return memory
+
+        first = groq_ai.ask("What about the second one?", memory=brake_conversation())
+        repeat = groq_ai.ask("What about the second one?", memory=brake_conversation())
+
+        assert first == repeat == "Semi-metallic pads last longer."
+        groq_ai._call_groq.assert_called_once()
+        assert len(groq_ai.cache) == 2
+
+    def test_conversations_keep_separate_memory(self, groq_ai):
+        """Test that ask(memory=...) records the exchange in that conversation only."""
+        groq_ai._call_groq = Mock(return_value="Every 6 months.")
+        conversation = ConversationMemory()
+
+        groq_ai.ask("When should I change the oil?", memory=conversation)
+
+        assert len(conversation) == 2
+        assert len(groq_ai.memory) == 0
+        # The conversation's history, not the default memory, went into the prompt
+        groq_ai._call_groq.assert_called_once_with("When should I change the oil?", [], conversation)
+
+    def test_fallback_without_httpx_not_cached(self, groq_ai, monkeypatch):
+        """Test that the rule-based answer given when httpx is missing is not cached."""
+        monkeypatch.setattr("chatbot.vehicle_ai._httpx_available", False)
+
+        groq_ai.ask("When should I change the oil?")
+
+        assert len(groq_ai.cache) == 0
+
+
+class TestVehicleAIAskBatch:
+    """Tests for VehicleAI ask_batch."""
+
+    def test_batch_rule_based_uses_one_retrieval(self, mock_retriever):
+        """Test that the batch is retrieved in one call and answered per question."""
+        mock_retriever.retrieve_batch.return_value = [["Oil every 6 months"], ["Rotate every 10,000 km"]]
+        ai = VehicleAI(retriever=mock_retriever)
+
+        answers = asyncio.run(ai.ask_batch(["Oil?", "Tires?"]))
+
+        mock_retriever.retrieve_batch.assert_called_once_with(["Oil?", "Tires?"], k=3)
+        assert "Oil every 6 months" in answers[0]
+        assert "Rotate every 10,000 km" in answers[1]
+        assert [turn["content"] for turn in ai.memory.history] == ["Oil?", answers[0], "Tires?", answers[1]]
+
+    def test_batch_concurrent_calls_keep_order(self, groq_ai, mock_retriever):
+        """Test that concurrent LLM calls finishing out of order are returned and remembered in order."""
+        mock_retriever.retrieve_batch.side_effect = lambda questions, k: [[f"Chunk for {q}"] for q in questions]
+        groq_ai._retriever = mock_retriever
+        groq_ai.memory.add("user", "Earlier question")
+        groq_ai.memory.add("assistant", "Earlier answer")
+        seen_history = {}
+
+        async def acall(question, chunks):
+            seen_history[question] = len(groq_ai.memory)
+            # Later questions finish first
+            await asyncio.sleep(0.01 * (3 - int(question[-1])))
+            return f"Answer {question[-1]} ({chunks[0]})"
+
+        groq_ai._acall = acall
+        questions = ["Question 1", "Question 2", "Question 3"]
+
+        answers = asyncio.run(groq_ai.ask_batch(questions))
+
+        assert answers == [f"Answer {i} (Chunk for Question {i})" for i in (1, 2, 3)]
+        # Every prompt was built against the history as it was before the batch
+        assert seen_history == {q: 2 for q in questions}
+        assert [turn["content"] for turn in list(groq_ai.memory.history)[2:]] == [
+            "Question 1", answers[0], "Question 2", answers[1], "Question 3", answers[2],
+        ]
 
 
 class TestVehicleAIIntegration:
     """Integration tests for VehicleAI."""
 
-    def test_full_conversation_flow(self):
-        """Test a full conversation with multiple turns."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            ai._retriever = None
-            ai._retriever_initialized = True
-            
-            response1 = ai.ask("What is the oil change interval?")
-            assert isinstance(response1, str)
-            assert len(ai.memory) == 2
-            
-            response2 = ai.ask("What about synthetic oil?")
-            assert isinstance(response2, str)
-            assert len(ai.memory) == 4
-
-    def test_memory_persistence_across_questions(self):
-        """Test that memory persists across multiple questions."""
-        from chatbot.vehicle_ai import VehicleAI
-        
-        with patch.dict(os.environ, {}, clear=True):
-            ai = VehicleAI()
-            ai._retriever = None
-            ai._retriever_initialized = True
-            
-            ai.ask("Question 1")
-            ai.ask("Question 2")
-            ai.ask("Question 3")
-            
-            context = ai.memory.get_context_string()
-            assert "Question 1" in context
-            assert "Question 2" in context
-            assert "Question 3" in context
+    def test_full_conversation_flow(self, ai):
+        """Test a full conversation: each ask returns text and adds a user + assistant turn."""
+        response1 = ai.ask("What is the oil change interval?")
+        assert isinstance(response1, str)
+        assert len(response1) > 0
+        assert len(ai.memory) == 2
+        assert ai.memory.history[-1]["content"] == response1
+
+        response2 = ai.ask("What about synthetic oil?")
+        assert isinstance(response2, str)
+        assert len(response2) > 0
+        assert len(ai.memory) == 4
+
+    def test_memory_persistence_across_questions(self, ai):
+        """Test that memory persists across multiple ask() calls."""
+        questions = ("Question 1", "Question 2", "Question 3")
+        for question in questions:
+            ai.ask(question)
+
+        assert len(ai.memory) == 6
+        context = ai.memory.get_context_string()
+        assert all(question in context for question in questions)